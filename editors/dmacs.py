@@ -49,6 +49,7 @@ def cancelled(response):
 def request(prompt):
     display.put_cursor(promptline, 1)
     display.kill_whole_line()
+    display.flush() # input() writes on the terminal, not with putstr
     terminal.set_line_mode()
     response = input(prompt)
     if cancelled(response):
@@ -140,16 +141,22 @@ def kill_line():
     else: 
         edsel.d(None,None,True) # consecutive C_k, append line to yank buffer
 
-def reload_buffer():
+def reload_buffer(modname=None):
     'Reload module for current buffer'
-    modname = ed.bufname[:-3] # trim trailing '.py'
+    if not modname: modname = ed.bufname[:-3] # trim trailing '.py'
     importlib.reload(sys.modules[modname])
     print(f'Reload module {modname}\n\r', end='') # \n\r end for char mode
 
 def save_reload():
     'Write out buffer, reload module, so file and module stay consistent.'
-    edsel.w()
-    reload_buffer() # synchronization?  Does w() finish before reload() begins?
+    modname = ed.bufname[:-3] # current buffer might change before write is done
+    future = edsel.w()
+    if future: # write is running in a thread, reload when it is done
+        future.add_done_callback(
+            lambda future: future.cancelled() or future.exception()
+                           or reload_buffer(modname))
+    else:
+        reload_buffer(modname)
 
 # Table from keys to editor functions
 keymap = {
@@ -177,6 +184,10 @@ keymap = {
     key.M_carat: (lambda: in_region(edsel.j)), # join lines
     key.C_c + '>': (lambda: in_region(edsel.indent)), # like emacs Python mode
     key.C_c + '<': (lambda: in_region(edsel.outdent)),
+    # undo
+    key.C_underscore: edsel.u, # also ^/ on many terminals
+    key.C_x + 'u': edsel.u,
+    key.C_M_underscore: edsel.redo,
     # buffers and files
     key.C_x + 'b' : switch_buffer,
     key.C_x + key.C_b: ed.n, # list buffers  
@@ -187,6 +198,7 @@ keymap = {
     key.C_x + key.C_r : save_reload, # *not* like emacs find-file read-only
     # windows
     key.C_x + '2' : edsel.o2,
+    key.C_x + '3' : edsel.o3,
     key.C_x + '1' : edsel.o1,
     key.C_x + 'o' : edsel.on,
     # miscellaneous
@@ -232,7 +244,8 @@ def dm():
                 # preserve prev_cmd after dm exit for debugging and resuming
                 break
             else:
-                runcmd(k)
+                with display.frame(): # one write for the whole command
+                    runcmd(k)
     terminal.set_line_mode()
     close_promptline()
     display.put_cursor(edsel.tlines, 1) # return cursor to command line
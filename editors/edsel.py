@@ -7,9 +7,39 @@ See README.md for directions on using edsel, NOTES.txt about its code.
 """
 
 import sys # skip argument declaration has file=sys.stdout
-import terminal_util, display
+import copy # deepcopy layout, so split can check new layout before using it
+import functools # partial, so each buffer's observer knows the buffer name
+import terminal_util, display, screen, highlight
 import sked as ed
 
+class Window():
+    """
+    Items of one window: its place and size in the frame, the buffer it
+    shows, and that buffer's segment, dot and point in this window.  The windows dict
+    maps each window key to its Window.  The items of the focus window are
+    also globals here and in sked, save_window assigns them into the slots
+    of its Window and restore_window assigns them back, so switching
+    windows makes no new objects.  Like sked.Buffer, Window supports
+    win['dot'] and win.get('dot', 0) too.
+    """
+    __slots__ = ('wintop', 'wheight', 'buftop', 'bufname', 'dot', 'point',
+                 'winleft', 'wwidth')
+
+    def __init__(self, wintop=1, wheight=20, buftop=1, bufname='scratch.txt',
+                 dot=0, point=0, winleft=1, wwidth=80):
+        self.wintop = wintop
+        self.wheight = wheight
+        self.buftop = buftop
+        self.bufname = bufname
+        self.dot = dot
+        self.point = point
+        self.winleft = winleft
+        self.wwidth = wwidth
+
+    __getitem__ = ed.Buffer.__getitem__
+    __setitem__ = ed.Buffer.__setitem__
+    get = ed.Buffer.get
+
 # Define and initialize global variables used by this module,
 # but only the *first* time this module is imported.
 # Then we can reload this module without re-initializing those variables.
@@ -32,20 +62,35 @@ except:
     
     wintop = 1 # index in frame of top line of focus window
     wheight = flines # N of lines in focus window, including status line.
+    winleft = 1 # column of left edge of focus window
+    wwidth = tcols # N of columns in focus window
     buftop = 1 # index in buffer of line at the wintop, top of the window.
     bufname = 'scratch.txt' # name of buffer displayed in focus window
     
     displaying = False  # initially display is not enabled.
     
-    # saved windows including focus window, dict of dicts of window items
+    # saved windows including focus window, dict of Window of window items
     # windows are identified by integer keys
     # saved windows are a dict not a list because smallest key might not be 0
     focus = 0 # key of focus window
-    maxwindows = 2 # the most that are useful in a vertical stack in 20+ lines
+    maxwindows = 16 # the most windows in the frame, each needs a few lines
+    minwidth = 10 # fewest columns in a window made by o3
     windows = {}
-    windows[focus] = { 'wintop': wintop, 'wheight': wheight, 'buftop': buftop,
-                       'bufname': ed.bufname, 'dot': ed.dot, 'point': ed.point }
-    wkeys = [ focus ] # keys of displayed windows, from top to bottom of frame
+    windows[focus] = Window(wintop, wheight, buftop, ed.bufname, ed.dot,
+                            ed.point, winleft, wwidth)
+    wkeys = [ focus ] # keys of displayed windows, from top left to bottom right
+    # Layout tree of windows in the frame, see arrange.  A leaf is a window
+    # key, a split is a list: 'v' or 'h' then the trees it divides equally,
+    # 'v' one above the other, 'h' side by side.
+    layout = focus
+    owner = [] # owner[line][column] is key of window there, see window_at
+    showing = {} # buffer name to list of keys of windows that show it
+    # Window key to (first, last) lines in its buffer that changed since
+    # its rows were drawn, last None when the lines below moved, see repaint.
+    dirty = {}
+    watching = {} # buffer name to its observer that marks dirty, see watch
+    statuses = {} # window key to status line as last drawn, see put_status
+    highlighting = {} # buffer name to its highlight.Highlighter, see syntax
     
 
 # Display functions: building blocks
@@ -69,54 +114,91 @@ def wbottom():
     """
     return wintop + wheight - 1
 
+def full_width():
+    'Return True if focus window spans the frame, no window beside it'
+    return winleft == 1 and wwidth >= tcols
+
+def segment(iline, height):
+    'Return buftop that best positions iline in a window height lines high'
+    if iline < height - 1: # iline is near top of buffer, show first page
+        return 1
+    else: 
+        return iline - (height // 2) # put iline near center of window
+
 def locate_segment(iline):
     """
     iline is line in the buffer.
     Select segment to put in window, that best positions iline in the window.
     Return buftop, line in current buffer to put at top line in window
     """
-    if iline < wheight - 1: # iline is near top of buffer, show first page
-        return 1
-    else: 
-        return iline - (wheight // 2) # put iline near center of window
+    return segment(iline, wheight)
 
 def update_lines(bstart, wstart, nlines):
     """
     Display consecutive lines (a 'segment') from the buffer in the window.
     Display nlines, starting at bstart in buffer, starting at wstart in window.
     Clip nlines if needed, to fit in window, and not run past end of buffer.
-    Leave cursor after the last line displayed, but do not update any globals.
+    Only updates the screen model, screen.flush sends the changes to display.
+    Do not update any globals.
     """
     nlines = min(nlines, wbottom()-wstart+1) # n of lines at end of window
-    nlines = min(nlines, len(ed.buffer)-bstart+1) # n of lines at e.o. buffer
-    display.put_cursor(wstart, 1)
-    for line in ed.buffer[bstart:bstart+nlines]:
-        display.putstr(line.rstrip('\n')[:tcols])
-        display.kill_line() # end of buffer line to window edge
-        display.next_line()
+    draw_lines(ed.buffer, bstart, wstart, nlines, winleft, wwidth,
+               highlighting.get(ed.bufname))
 
-def update_window():
-    'Update entire window up to status line, starting at line buftop in buffer'
-    update_lines(buftop, wintop, wheight-1)
+def put_row(wiline, cells, left=1, width=None):
+    """
+    Show cells on display line wiline in the columns of a window that
+    starts at column left and is width columns wide, default all columns.
+    A window beside others only replaces its own columns, padded with
+    blanks, and leaves its last column blank to separate it from the
+    window on its right.  Only updates the screen model.
+    """
+    if left == 1 and (width is None or width >= tcols): # just update the line
+        screen.update(wiline, cells[:tcols])
+        return
+    ncells = width - 1 if left + width - 1 < tcols else width
+    cells = cells[:ncells]
+    screen.put(wiline, left, cells + [ screen.blank ] * (width - len(cells)))
+
+def draw_lines(text, bstart, wstart, nlines, left=1, width=None,
+               colors=None):
+    """
+    Display nlines from text, a buffer, starting at bstart in text,
+    starting at wstart on display, in the columns of a window as in put_row.
+    colors is the buffer's highlight.Highlighter, None for plain text.
+    Stop at the end of text.
+    """
+    for i, line in enumerate(text[bstart:bstart+nlines]):
+        line = line.rstrip('\n')
+        if colors:
+            cells = highlight.cells(line, colors.spans(bstart + i))[:tcols]
+        else:
+            cells = screen.cells(line.expandtabs()[:tcols])
+        put_row(wstart + i, cells, left, width)
 
-def erase_lines(nlines):
+def erase_lines(wstart, nlines, left=1, width=None):
     """
-    Completely erase nlines lines starting at current cursor position.
-    Leave cursor at line after last line erased.  Do not update any globals.
+    Erase nlines lines in window starting at wstart, columns as in put_row.
+    Do not update globals.
     """
-    for iline in range(nlines):
-        display.kill_whole_line()
-        display.next_line()
+    for iline in range(wstart, wstart + nlines):
+        put_row(iline, [], left, width)
+
+def update_window():
+    'Update entire window up to status line, starting at line buftop in buffer'
+    dirty.pop(focus, None) # all rows are drawn here
+    update_lines(buftop, wintop, wheight-1)
+    nshown = max(0, min(wheight-1, len(ed.buffer)-buftop)) # n of buffer lines
+    erase_lines(wintop + nshown, wheight-1 - nshown, # empty lines after buffer
+                winleft, wwidth)
 
 def erase_bottom():
     """
     Erase any old lines left over between end of buffer and bottom of window.
-    Leave cursor after last line erased.  Do not update any globals.
+    Do not update any globals.
     """
-    nlines = wheight - wline(ed.dot) # n of lines to end of window
-    nblines = ed.S() - (ed.dot + 1) # n of lines to end of buffer
-    nelines = nlines - nblines # n of empty lines at end of window
-    erase_lines(nelines+1) # sic +1.  make empty lines at end of window.
+    wstart = wline(ed.S()) + 1 # first line in window after end of buffer
+    erase_lines(wstart, wbottom() - wstart, winleft, wwidth)
 
 def update_below(bstart, offset=0):
     """
@@ -124,7 +206,7 @@ def update_below(bstart, offset=0):
     down to (but not including) the status line. Accept default offset=0 
     to begin updating at present position of bstart in the window, or
     optionally assign offset to move bstart and following lines down.
-    Leave cursor after last line displayed. Do not update any globals.
+    Do not update any globals.
     """
     wstart = wline(bstart) + offset
     nlines = wbottom() - wstart
@@ -137,40 +219,65 @@ def open_line(iline):
     """
     global buftop
     if not in_window(iline+1):
-        display.put_cursor(wintop, 1) # first line of window
-        erase_lines(wheight-1) # erase window contents but not status line
         buftop = locate_segment(iline)
         update_window()
-    display.put_cursor(wline(iline+1), 1)
+    put_row(wline(iline+1), [], winleft, wwidth) # clear line for input()
     if ed.S() >= iline+1: # more lines after this one in buffer
-        display.kill_line() # clear this line to prepare for input()
         update_below(iline + 1, 1) # offset 1 for line we just cleared
-        display.put_cursor(wline(iline+1),1) # restore cursor after update_...
+    screen.flush()
+    display.put_cursor(wline(iline+1), winleft)
 
-def put_marker(bufline, attribs):
-    'On the display, mark first char in line bufline in buffer with attribs'
-    line = ed.buffer[bufline] if ed.buffer and 1 <= bufline <= ed.S() else ''
+def put_marker(bufline, attribs, win=None):
+    """
+    On the display, mark first char in line bufline in buffer with attribs.
+    win is a saved Window from windows, default is the focus window.
+    """
+    if win is None:
+        text, wiline, left = ed.buffer, wline(bufline), winleft
+        colors = highlighting.get(ed.bufname)
+    else:
+        text = window_lines(win)
+        wiline = win.wintop + max(bufline - win.buftop, 0)
+        left = win.winleft
+        colors = highlighting.get(win.bufname)
+    line = text[bufline] if text and 1 <= bufline <= len(text)-1 else ''
     ch0 = line[0] if line.rstrip('\n') else ' ' # line might be empty or RET 
-    display.put_cursor(wline(bufline), 1)
-    display.render(ch0, attribs)
+    cells = screen.cells(ch0.expandtabs(1), attribs)
+    if colors and attribs == display.clear: # unmark, restore its color
+        cells = highlight.cells(ch0, colors.spans(bufline))[:1]
+    screen.put(wiline, left, cells)
 
 def restore_cursor_to_cmdline():
+    """
+    Send any changes in the frame to the display, then put cursor in REPL,
+    so messages printed next appear at the cursor.  Don't wait for the
+    terminal: if it is behind, the rest is sent when it is ready.
+    """
+    screen.flush()
     display.put_cursor(tlines, 1)
+    display.send()
+
+def put_status(wkey, status, wiline, left, width):
+    'Put status text on line wiline of window wkey, unless already there'
+    if statuses.get(wkey) != (wiline, left, width, status):
+        statuses[wkey] = (wiline, left, width, status)
+        put_row(wiline, screen.cells(status.ljust(tcols)[:tcols],
+                                     display.white_bg), left, width)
 
 def update_status():
-    'Update status line at the bottom of the window'
-    display.put_cursor(wbottom(), 1)
-    display.render(ed.status().ljust(tcols)[:tcols],display.white_bg)  
+    'Update status line at the bottom of the window, if its text changed'
+    put_status(focus, ed.status(), wbottom(), winleft, wwidth)
     restore_cursor_to_cmdline()
 
 def refresh():
     """
     Refresh the focus window.
     (Re)Display lines from segment, marker, status without moving segment.
+    screen only sends lines that differ from what is already on the display.
     """
-    display.put_cursor(wintop, 1) # top line in window
-    erase_lines(wheight-1) # erase entire window contents above status line
-    update_window() # FIXME did we really have to erase_lines before this?
+    watch() # buffer might have been loaded by sked, not by e here
+    update_window()
+    repaint() # other windows that show changed lines
     put_marker(ed.dot, display.white_bg)
     update_status()
     
@@ -180,6 +287,188 @@ def recenter():
     buftop = locate_segment(ed.dot)
     refresh()
 
+def scroll(nlines):
+    """
+    Move buffer segment down nlines in buffer, up if nlines < 0.
+    Scroll the lines still in window on display, so next refresh
+    only draws the lines that are new.  Do not refresh here.
+    """
+    global buftop
+    # The terminal scrolls whole lines, so not a window beside others
+    if 0 < abs(nlines) < wheight - 1 and full_width():
+        screen.scroll(wintop, wbottom()-1, nlines)
+    buftop += nlines
+
+# Display functions: any window
+
+# The functions above draw the focus window, which shows the current buffer.
+# These draw a saved window from its dict in windows and its own buffer,
+# so a task can update a window that is not the focus window, without
+# restoring its buffer or changing focus, dot or point.
+
+def window_lines(win):
+    'Return lines in buffer shown in saved window win, maybe current buffer'
+    bname = win.bufname
+    return ed.buffer if bname == ed.bufname else ed.buffers[bname]['buffer']
+
+def draw_window(wkey):
+    """
+    Draw saved window wkey: lines from its buftop, marker at its dot,
+    and status line.  Only updates the screen model, like update_lines.
+    """
+    dirty.pop(wkey, None) # all rows are drawn here
+    win = windows[wkey]
+    top, height, btop = win.wintop, win.wheight, win.buftop
+    left, width = win.winleft, win.wwidth
+    text = window_lines(win)
+    nshown = max(0, min(height-1, len(text)-btop)) # n of buffer lines
+    draw_lines(text, btop, top, nshown, left, width,
+               highlighting.get(win.bufname))
+    erase_lines(top + nshown, height-1 - nshown, left, width) # after buffer
+    put_marker(win.dot, display.white_bg, win)
+    put_window_status(wkey)
+
+def put_window_status(wkey):
+    'Put status line of saved window wkey, unless already there'
+    win = windows[wkey]
+    # current buffer items might differ from saved
+    status = ed.status(None if win.bufname == ed.bufname
+                       else ed.buffers[win.bufname], win.dot)
+    put_status(wkey, status, win.wintop + win.wheight-1, win.winleft,
+               win.wwidth)
+
+def follow(wkey, iline):
+    """
+    Move dot in saved window wkey to iline, and its segment to show iline.
+    When iline is just below the window, scroll lines that stay in window.
+    Then draw the window.  Focus, current buffer and its dot do not change.
+    """
+    win = windows[wkey]
+    height = win.wheight
+    win.dot = iline
+    nbelow = iline - (win.buftop + height - 2) # N of lines below window
+    if 0 < nbelow < height - 1:
+        if win.winleft == 1 and win.wwidth >= tcols: # see scroll
+            screen.scroll(win.wintop, win.wintop + height - 2, nbelow)
+        win.buftop += nbelow
+    elif not (win.buftop <= iline <= win.buftop + height - 2):
+        win.buftop = segment(iline, height)
+    draw_window(wkey)
+
+# Display functions: dirty rows
+
+# Editing commands do not say which rows to redraw.  Each buffer shown in
+# a window has an observer, see sked.observe, that marks the lines each
+# change replaced in dirty, for every window that shows that buffer.  After
+# the command, display_changes calls repaint, which redraws only the rows
+# in each window that show dirty lines, once, however many changes made them.
+
+def changed(bname, start, nold, lines):
+    """
+    Observer of buffer bname, mark changed lines dirty in its windows.
+    With syntax colors, also lines below whose colors changed.
+    """
+    if not (nold or lines):
+        return
+    colors = highlighting.get(bname)
+    recolored = colors.update(start, nold, lines) if colors else start
+    # Inserting or deleting lines moves all the lines below
+    last = start + len(lines) - 1 if nold == len(lines) else None
+    if last is not None: last = max(last, recolored - 1)
+    mark(bname, start, last)
+
+def mark(bname, start, last):
+    'Mark lines start through last dirty in windows of bname, None: to end'
+    for wk in visible(bname):
+        first0, last0 = dirty.get(wk, (start, last))
+        both = None if last is None or last0 is None else max(last0, last)
+        dirty[wk] = (min(first0, start), both)
+
+def watch(bname=None):
+    'Observe changes to buffer bname, default current, if not already'
+    if not bname: bname = ed.bufname
+    if bname != ed.bufname and bname not in ed.buffers:
+        return
+    observer = watching.setdefault(bname, functools.partial(changed, bname))
+    bobservers = (ed.observers if bname == ed.bufname
+                  else ed.buffers[bname].observers)
+    if observer not in bobservers:
+        ed.observe(observer, bname)
+
+def drawn(iline):
+    'Line iline is already drawn in the focus window, so not dirty there'
+    if dirty.get(focus) == (iline, iline):
+        del dirty[focus]
+
+def repaint():
+    """
+    Redraw the dirty rows in each window, the rows that show lines that
+    changed or moved, and the marker and status line of each window that
+    is not the focus window.  Only updates the screen model.
+    """
+    for wkey, (first, last) in list(dirty.items()):
+        del dirty[wkey]
+        if wkey == focus:
+            text, top, height, btop = ed.buffer, wintop, wheight, buftop
+            left, width, bname = winleft, wwidth, ed.bufname
+        elif wkey in wkeys and (windows[wkey].bufname == ed.bufname
+                                or windows[wkey].bufname in ed.buffers):
+            win = windows[wkey]
+            text = window_lines(win)
+            top, height, btop = win.wintop, win.wheight, win.buftop
+            left, width, bname = win.winleft, win.wwidth, win.bufname
+        else:
+            continue
+        if wkey != focus: # N of lines in status might change
+            put_window_status(wkey)
+        bottom = btop + height - 2 # last line in buffer that fits in window
+        first = max(first, btop)
+        last = bottom if last is None else min(last, bottom)
+        if first > last:
+            continue
+        nshown = max(0, min(last+1, len(text)) - first) # rest are past end
+        wstart = top + first - btop
+        draw_lines(text, first, wstart, nshown, left, width,
+                   highlighting.get(bname))
+        erase_lines(wstart + nshown, last-first+1 - nshown, left, width)
+        if wkey != focus and first <= win.dot <= last:
+            put_marker(win.dot, display.white_bg, win)
+
+def syntax(on=True, bname=None):
+    """
+    Show buffer bname, default current buffer, with Python syntax colors,
+    or as plain text if not on.  Colors are updated incrementally as the
+    buffer changes, see highlight.
+    """
+    if not bname: bname = ed.bufname
+    if bname != ed.bufname and bname not in ed.buffers:
+        print(f'? no buffer {bname}\r\n', end='')
+        return
+    if on and bname not in highlighting:
+        text = ed.buffer if bname == ed.bufname else ed.buffers[bname].buffer
+        highlighting[bname] = highlight.Highlighter(text)
+        watch(bname) # changed updates colors
+    elif not on:
+        highlighting.pop(bname, None)
+    mark(bname, 0, None) # redraw its windows
+    if bname == ed.bufname:
+        display_changes()
+    else:
+        repaint()
+        restore_cursor_to_cmdline()
+
+def display_changes():
+    """
+    Display effect of an editing command, after all its changes: repaint
+    dirty rows, mark dot, update status.  Recenter if dot left the window.
+    """
+    if in_window(ed.dot):
+        repaint()
+        put_marker(ed.dot, display.white_bg)
+        update_status()
+    else:
+        recenter()
+
 # Display functions: show effects of editing commands
 
 def display_move_dot(iline):
@@ -189,19 +478,22 @@ def display_move_dot(iline):
     if in_window(ed.dot):
         put_marker(ed.dot, display.white_bg)
         update_status()
-    else:
-        recenter()
+    else: # shift lines that stay in the window, draw only the new ones
+        below = ed.dot - (buftop + wheight - 2) # N of lines past the bottom
+        above = ed.dot - buftop # negative, N of lines above the top
+        if 0 < below < wheight - 1:
+            scroll(below) # dot on the bottom line
+        elif -(wheight - 1) < above < 0:
+            scroll(above) # dot on the top line
+        else: # jumped farther than a window, like recenter
+            scroll(locate_segment(ed.dot) - buftop)
+        refresh()
 
 def display_change_lines(start, end):
     'Display effect of ed change_lines fcn. Redraw start to end, move dot.'
     put_marker(ed.dot, display.clear)
     ed.move_dot(end)
-    if in_window(ed.dot):
-        update_lines(start, wline(start), end-start+1) # bstart, wstart, nlines
-        put_marker(ed.dot, display.white_bg)
-        update_status()
-    else:
-        recenter()
+    display_changes()
 
 def print_nothing(value, sep=' ', end='\n', file=sys.stdout, flush=False):
     """
@@ -214,12 +506,15 @@ def display_restore_buffer(bname):
     'Display effect of ed restore_buffer function, fill entire window'
     ed.restore_buffer(bname, print_nothing)
     save_window_bufinfo()
+    watch()
     recenter()
 
 def display_e(iline):
     'Display effect of ed e(dit) fcn: display new buffer contents around iline'
+    highlighting.pop(ed.bufname, None) # new buffer might reuse a killed name
     ed.move_dot(iline)
     save_window_bufinfo()
+    watch()
     recenter()
 
 def display_set_saved(status):
@@ -231,21 +526,14 @@ def display_d(iline):
     """
     Display effect of ed d(elete) function, deleting one or more lines.
     iline (dot) is the last line before the delete, iline+1 is first line after.
-    Move dot to iline and update display from dot + 1 to end of window,
-    because all lines below the deleted lines must be moved up.
-    At the end of the buffer, write empty lines at the bottom of the window.
+    Move dot to iline.  The lines below the deleted lines moved up, so
+    repaint their rows, and erase rows left empty at the end of the buffer.
     Also move marker and update status line. Page down if needed.
     """
     put_marker(ed.dot, display.clear)
     # ed.move_dot(iline) # move_dot sets point = 0, we *don't* want that here
     ed.dot = iline # but no point = 0
-    if in_window(ed.dot):
-        update_below(ed.dot) # doesn't change dot, moves cursor to end of text
-        erase_bottom()
-        put_marker(ed.dot, display.white_bg)
-        update_status() 
-    else:
-        recenter()
+    display_changes()
 
 def display_y(iline):
     """
@@ -254,37 +542,24 @@ def display_y(iline):
     iline here is the new dot, the first line after the yanked lines
     (this is actually the same line of text where dot was before yank).
     The first of the lines appended from yank is at iline - len(yank)
-    Update the display from there to the end of the window.
+    Repaint the rows from there to the end of the window.
     Also move marker and update status line. Page down if needed.
     """
     put_marker(ed.dot, display.clear)
     ed.move_dot(iline)
-    if in_window(ed.dot):
-        update_below(ed.dot - len(ed.killed)) # first yanked line
-        erase_bottom()
-        put_marker(ed.dot, display.white_bg)
-        update_status() 
-    else:
-        recenter()
+    display_changes()
 
 def display_c(iline):
     """
     Display the effect of the ed c(hange) function, replacing the changed line.
     A call to c() might call this several times, once for each changed line.
-    Move dot to iline, redisplay line, mark current line, update the status.
+    Only move dot to iline, c below displays all the changed lines at once.
     """
     put_marker(ed.dot, display.clear)
     ed.move_dot(iline)
-    display.put_cursor(wline(ed.dot), 1)
-    display.putstr(ed.buffer[ed.dot].rstrip('\n')[:tcols])
-    display.kill_line()
-    put_marker(ed.dot, display.white_bg)
-    update_status()
 
 def display_j(iline):
     'Display effect of ed j(oin lines) function.'
-    display.put_cursor(wline(iline), 1)
-    display.putstr(ed.buffer[iline].rstrip('\n')[:tcols])
     display_d(iline) # assigns ed.dot directly, not with display_move_dot
 
 # Display functions: append mode for sked a() command
@@ -294,14 +569,20 @@ def display_j(iline):
 # Exit append mode by typing . by itself at the start of a line.
 # We do not update the status line in append mode, to minimize cursor motion.
 
+def display_undo(iline):
+    'Display effect of ed u(ndo) or redo: repaint the lines it changed'
+    put_marker(ed.dot, display.clear)
+    ed.move_dot(iline)
+    display_changes()
+
 def display_start_a(iline):
     """
     Call once when user types a() in the REPL. Move dot to iline.
     Open line after dot. Put cursor there to prepare for display_input_line.
     If any text after dot, push it all down one line to make room for new line.
     """
-    display.put_cursor(wheight, 1) # status line does not update in append mode
-    display.render('Appending...'.ljust(tcols)[:tcols],display.white_bg)  
+    # status line does not update in append mode
+    put_status(focus, 'Appending...', wbottom(), winleft, wwidth)
     put_marker(ed.dot, display.clear)
     ed.move_dot(iline) # sked a() does this.  iline might be far from previous dot.
     open_line(ed.dot) # create space, move cursor to prepare for first input()
@@ -315,15 +596,18 @@ def display_input_line():
     This function only updates window when exiting append mode after '.'
     display_a updates window when input() returns a line of text to append.
     """
+    display.flush() # input() writes on the terminal, not with putstr
     line = input() # sked a() does this
+    screen.forget(wline(ed.dot)+1) # input() wrote on the display, not screen
     if line == '.': # done with append mode, so close line
         if ed.S() > ed.dot:  # more in the buffer after this line
             update_below(ed.dot + 1)
             if in_window(ed.S()+1): # on the last page, at least one empty line
-                display.kill_whole_line() # extra line left by removing '.'
+                # extra line left by '.'
+                put_row(wline(ed.S())+1, [], winleft, wwidth)
         else: # at the end of the buffer
-            display.put_cursor(wline(ed.dot)+1,1)
-            display.kill_whole_line() # erase '.'
+            put_row(wline(ed.dot)+1, [], winleft, wwidth) # erase '.'
+        repaint() # lines appended with syntax colors, see display_a
         put_marker(ed.dot, display.white_bg)
         update_status() # also returns cursor to REPL command line
     return line # caller sked a() tests line, may exit from append mode
@@ -340,20 +624,30 @@ def display_a(iline):
     put_marker(ed.dot, display.clear)
     ed.move_dot(ed.dot + 1)  # advance dot to line just input(), like sked a()
     open_line(ed.dot) # create space, move cursor to prepare for next input()
+    # input() drew the new line and open_line the lines it moved down,
+    # without syntax colors, so repaint them after append mode
+    if ed.bufname not in highlighting:
+        dirty.pop(focus, None)
 
 # Display functions: editing commands
 
 def e(fname):
     ed.e(fname, display_e)
 
+def view(fname):
+    ed.view(fname, display_e)
+
 def b(bname=None):
     ed.b(bname, display_restore_buffer)
 
 def k():
     ed.k(display_restore_buffer)
 
+def recover():
+    ed.recover(display_e)
+
 def w(fname=None):
-    ed.w(fname, display_set_saved)
+    return ed.w(fname, display_set_saved) # future if write is not done
 
 def display_p(start=None, end=None):
     ed.p(start, end, print_nothing, display_move_dot)
@@ -391,7 +685,10 @@ def y(iline=None):
     ed.y(iline, display_y)
 
 def c(old=None, new=None, start=None, end=None, count=-1):
+    version = ed.version
     ed.c(old, new, start, end, count, print_nothing, display_c)
+    if ed.version != version: # some line changed
+        display_changes()
 
 def indent(start=None, end=None, nspaces=None, outdent=False):
     ed.indent(start, end, nspaces, outdent, display_change_lines)
@@ -405,6 +702,12 @@ def wrap(start=None, end=None, lmarg=None, rmarg=None):
 def j(start=None, end=None):
     ed.j(start, end, move_dot=display_j)
 
+def u():
+    ed.u(display_undo)
+
+def redo():
+    ed.redo(display_undo)
+
 # Display functions: window management
 
 def n_windows(): 
@@ -416,8 +719,9 @@ def open_frame():
     Create a 'frame' to contain windows, potentially more than one.
     Clear display above status line and limit scrolling to the lines below.
     """
-    display.put_cursor(wheight, 1) # window status line
-    display.erase_above()
+    erase_lines(1, flines) # through bottom window status line
+    statuses.clear()
+    screen.flush()
     display.set_scroll(flines+1, tlines)
 
 def win(nlines=None):
@@ -425,24 +729,24 @@ def win(nlines=None):
     Create or resize win(dow) for display at the top of the terminal window.
     Frame size is stored in flines.  First, clear above flines to clear frame.
     If nlines is given, assign to flines.  Smaller nlines enlarges cmd region.
-    Use of flines and nlines here assumes just one window, maybe revise later.
     Set scrolling region to lines below flines.
-    Show status line about current buffer at bottom of frame.
+    Arrange the windows in the new frame and draw them, with status lines.
     """
-    global tlines, tcols, flines, wheight
+    global tlines, tcols, flines
     tlines, tcols = terminal_util.dimensions()
+    display.columns = tcols
+    screen.forget() # terminal window might be resized
     display.put_cursor(flines+1, 1)
     display.erase_above() # clear old window in case new nlines < flines
+    screen.erased(1, flines+1)
     if not nlines: nlines = flines
     if nlines > tlines - 2:
         print(f'? {nlines} lines will not fit in terminal of {tlines} lines')
         return
     flines = nlines
-    wheight = flines
-    ed.pagesize = wheight - 2
     ed.rmargin = tcols - 8
     open_frame()
-    recenter()
+    relayout()
 
 def save_window(wkey):
     """
@@ -452,8 +756,13 @@ def save_window(wkey):
     Assumes window's buffer is the current buffer, true in all save_window
     uses now.  Maybe not always true in the future, must review each new use.    .
     """
-    windows[wkey] = { 'wintop': wintop, 'wheight': wheight, 'buftop': buftop,
-                      'bufname': ed.bufname, 'dot': ed.dot, 'point': ed.point}
+    win = windows.get(wkey)
+    if win is None:
+        win = windows[wkey] = Window()
+    win.wintop, win.wheight, win.buftop = wintop, wheight, buftop
+    win.winleft, win.wwidth = winleft, wwidth
+    set_bufname(wkey, ed.bufname)
+    win.dot, win.point = ed.dot, ed.point
     ed.save_buffer() # Saves current buffer, assumed valid for windows[wkey]
 
 def save_window_bufinfo():
@@ -461,9 +770,9 @@ def save_window_bufinfo():
    Update focus window bufname, dot, and point in saved windows.
    Entry for focus window must already exist in saved windows.
    """
-   windows[focus]['bufname'] = ed.bufname
-   windows[focus]['dot'] = ed.dot
-   windows[focus]['point'] = ed.point
+   win = windows[focus]
+   set_bufname(focus, ed.bufname)
+   win.dot, win.point = ed.dot, ed.point
 
 def restore_window(wkey):
     """
@@ -471,76 +780,186 @@ def restore_window(wkey):
     If window uses a different buffer, restore that buffer too.
     """
     global focus, wintop, wheight, buftop # but not bufname, dot, they're in ed.
-    # default values for missing keys are just the current values
+    global winleft, wwidth
     focus = wkey
-    wintop = windows[wkey].get('wintop', wintop)
-    wheight = windows[wkey].get('wheight', wheight)
-    buftop = windows[wkey].get('buftop', buftop)
-    bufname = windows[wkey].get('bufname', ed.bufname) # *local* bufname here!
+    win = windows[wkey]
+    wintop, wheight, buftop = win.wintop, win.wheight, win.buftop
+    winleft, wwidth = win.winleft, win.wwidth
+    bufname = win.bufname # *local* bufname here!
     # Maybe bufname is not in buffers, it may have been killed.
     # But scratch.txt is always in buffers. 
     bufname = bufname if bufname in ed.buffers else 'scratch.txt'
     # If previous window has the same buffer, don't update prev_bufname
-    if bufname != ed.bufname: ed.prev_bufname = ed.bufname
-    ed.restore_buffer(bufname, print_nothing) # assign *global* ed.bufname here
+    # If it has the same buffer, the current buffer items are already there
+    if bufname != ed.bufname:
+        ed.prev_bufname = ed.bufname
+        ed.restore_buffer(bufname, print_nothing) # assign *global* ed.bufname
     # Window dot and point might be different than its buffer's, restored above.
     # Can be multiple windows looking at different locations in same buffer.
     if bufname != 'scratch.txt':
-        ed.dot = windows[wkey].get('dot', ed.dot)
-        ed.point = windows[wkey].get('point', ed.point)
+        ed.dot, ed.point = win.dot, win.point
  
-def o2():
-    'Split focus window, focus remains in top half, bottom half is new saved'
-    global wintop, wheight, wkeys
+
+def window_at(line, column):
+    'Return key of window at line and column on the display, or None'
+    if 1 <= line < len(owner) and 1 <= column < len(owner[line]):
+        return owner[line][column]
+    return None
+
+def visible(bname):
+    """
+    Return list of keys of windows that show buffer bname,
+    the focus window first if it is one of them.
+    """
+    others = [ wk for wk in showing.get(bname, ()) if wk != focus ]
+    # focus window shows current buffer, its saved bufname might be old
+    return [ focus ] + others if bname == ed.bufname else others
+
+def set_bufname(wkey, bname):
+    'Saved window wkey now shows buffer bname, update showing'
+    win = windows[wkey]
+    if win.bufname != bname and wkey in showing.get(win.bufname, ()):
+        showing[win.bufname].remove(wkey)
+    win.bufname = bname
+    if wkey in wkeys and wkey not in showing.setdefault(bname, []):
+        showing[bname].append(wkey)
+
+def arrange(node, top, left, height, width):
+    """
+    Assign place and size to each window in layout tree node, which fills
+    height lines and width columns from line top and column left.
+    Append window keys to wkeys, top left to bottom right, and fill owner.
+    """
+    if isinstance(node, int): # leaf, window key
+        win = windows[node]
+        win.wintop, win.winleft, win.wheight, win.wwidth = (top, left,
+                                                            height, width)
+        wkeys.append(node)
+        for line in range(top, top + height):
+            owner[line][left:left+width] = [ node ] * width
+        return
+    direction, children = node[0], node[1:]
+    extent = height if direction == 'v' else width
+    n = len(children)
+    start = 0
+    for i, child in enumerate(children): # the last ones get any remainder
+        size = extent // n + (1 if i >= n - extent % n else 0)
+        if direction == 'v':
+            arrange(child, top + start, left, size, width)
+        else:
+            arrange(child, top, left + start, height, size)
+        start += size
+
+def relayout():
+    """
+    Place every window in the frame as layout says, then draw them all.
+    Each window keeps its buffer and dot, its segment moves if it must.
+    """
+    global wkeys, owner
+    save_window(focus) # focus items in globals might be newer than saved
+    wkeys = []
+    owner = [ [ None ] * (tcols + 1) for _ in range(flines + 1) ]
+    arrange(layout, 1, 1, flines, tcols)
+    showing.clear()
+    statuses.clear() # windows moved, might cover old status lines
+    for wk in wkeys:
+        showing.setdefault(windows[wk].bufname, []).append(wk)
+        watch(windows[wk].bufname)
+        win = windows[wk]
+        if not (win.buftop <= win.dot <= win.buftop + win.wheight - 2):
+            win.buftop = segment(win.dot, win.wheight)
+        if wk != focus:
+            draw_window(wk)
+    restore_window(focus) # assign the new place and size of focus window
+    ed.pagesize = wheight - 2
+    refresh()
+
+def fits(node, height, width):
+    'Return True if every window in layout tree node has room in this area'
+    if isinstance(node, int):
+        return height >= 2 and width >= minwidth
+    direction, children = node[0], node[1:]
+    extent = height if direction == 'v' else width
+    n = len(children)
+    return all(fits(child, *((extent // n, width) if direction == 'v'
+                             else (height, extent // n)))
+               for child in children)
+
+def parent(node, wkey):
+    'Return the split in layout tree node that contains window wkey, or None'
+    if isinstance(node, int):
+        return None
+    if wkey in node[1:]:
+        return node
+    for child in node[1:]:
+        found = parent(child, wkey)
+        if found:
+            return found
+    return None
+
+def split(direction):
+    """
+    Split focus window, 'v' one above the other, 'h' side by side.
+    Focus stays in the first, the new window shows the same buffer.
+    If the focus window is already in a split the same way, the new
+    window joins that split, and all its windows share the space equally.
+    """
+    global layout
     if n_windows() >= maxwindows:
         print('? no more windows\r\n', end='')
         return
-    # When we split a window, top half remains focus window; keep same wintop.
-    prev_wheight = wheight # needed later to size lower window
-    wheight = wheight // 2 
-    ed.pagesize = wheight - 2
-    recenter()  # if dot was in lower half of window, move up. reassign buftop.
+    wkey = min(set(range(maxwindows)) - set(wkeys)) # key for new window
+    above = parent(layout, focus)
+    if above and above[0] == direction: # join this split
+        new = copy.deepcopy(layout)
+        parent(new, focus).insert(above.index(focus, 1) + 1, wkey)
+    else: # replace focus window with a new split
+        leaf = [ direction, focus, wkey ]
+        new = leaf if not above else copy.deepcopy(layout)
+        if above:
+            outer = parent(new, focus)
+            outer[outer.index(focus, 1)] = leaf
+    if not fits(new, flines, tcols):
+        print('? no room for another window\r\n', end='')
+        return
     save_window(focus)
-    # bottom half
-    wkey = (max(wkeys) + 1) % maxwindows  # wkey for new window
-    # insert new wkey into wkeys right after focus window entry
-    for ikey, _ in enumerate(wkeys):
-        if wkeys[ikey] == focus:
-            wkeys[ikey+1:ikey+1] = [ wkey ] # insert new wkey after focus entry
-            break
-    # Calculate new bottom window position, size
-    wintop = wintop + wheight
-    wheight = prev_wheight - wheight
-    recenter() # center dot in this window also, calculate new buftop.
-    save_window(wkey)
-    restore_window(focus)
+    windows[wkey] = Window(wintop, wheight, buftop, ed.bufname, ed.dot,
+                           ed.point, winleft, wwidth)
+    layout = new
+    relayout()
+
+def o2():
+    'Split focus window, focus remains in the top, bottom is new window'
+    split('v')
+
+def o3():
+    'Split focus window, focus remains in the left, right is new window'
+    split('h')
 
 def o1():
     'Return to single window, make focus window occupy the whole frame.'
-    global focus, wkeys, wintop, wheight
+    global focus, wkeys, layout
     if n_windows() <= 1:
         print('? only one window\r\n', end='')
         return
+    save_window(focus)
+    win = windows[focus]
     windows.clear()
     focus = 0
+    windows[focus] = win
     wkeys = [ focus ]
-    wintop = 1
-    wheight = flines
-    ed.pagesize = wheight - 2
-    recenter() # reassigns buftop
-    save_window(focus) # will be overwritten when next time window is split
+    layout = focus
+    relayout() # reassigns buftop if dot is not in the bigger window
 
 def on():
-    'Next window, move focus to next window below, until wrap around to top'
+    'Next window, move focus to next window below or right, then wrap around'
     global focus
     if n_windows() <= 1:
         print('? only one window\r\n', end='')
         return
     save_window(focus) # window contents (buffer and/or dot) may have changed
-    for ikey, wkey in enumerate(wkeys):
-        if wkeys[ikey] == focus:
-            break
-    ikey = (ikey + 1) % len(wkeys) # index of next window below, wrap around
+    ikey = wkeys.index(focus)
+    ikey = (ikey + 1) % len(wkeys) # index of next window, wrap around
     focus = wkeys[ikey]
     # What if buffer in new focus window has been killed?
     # Handle that in restore_window.
@@ -555,4 +974,6 @@ def zen(nlines=None):
 def clr():
     'cl(ea)r window from display by restoring full-screen scrolling'
     display.set_scroll(1, tlines)
+    screen.forget() # frame will scroll away
+    statuses.clear()
     restore_cursor_to_cmdline() # set_scroll leaves cursor on line 1
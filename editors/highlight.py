@@ -0,0 +1,151 @@
+"""
+highlight.py - Python syntax colors for the lines of an edsel buffer,
+               updated incrementally as the buffer changes.
+
+A line by itself does not say how to color it: it might be inside a
+triple-quoted string that began many lines above.  So Highlighter caches
+the lexer state at the start of each line, '' in code, or the quote of a
+string still open there.  Lexing a line takes its starting state and
+returns its colored spans and the state at the start of the next line.
+
+Lines are lexed when they are first drawn, from the top of the buffer
+down to that line, not when the buffer is loaded.  After a change, update
+lexes the new lines, then goes on only until a line starts in the same
+state it had before the change: every line after that is colored as it
+was.  So typing in a 10,000 line module lexes a line or two, and only
+opening or closing a triple-quoted string lexes farther down.
+
+See NOTES.txt for more notes.
+"""
+
+import re, keyword
+import display
+
+# attributes for screen cells of each kind of token, see screen.cells
+colors = {
+    'keyword': display.attrs(display.blue),
+    'string': display.attrs(display.green),
+    'comment': display.attrs(display.cyan),
+    'number': display.attrs(display.magenta),
+    'defname': display.attrs(display.bold), # name after def or class
+}
+
+keywords = frozenset(keyword.kwlist)
+
+token = re.compile(r"""
+  (?P<comment>\#.*)
+| (?P<string>[rRbBuUfF]{0,2}(?P<quote>'''|\"\"\"|'|\"))
+| (?P<number>\b(?:0[xXoObB][0-9a-fA-F_]+
+               |\d[\d_]*\.?[\d_]*(?:[eE][+-]?\d+)?[jJ]?))
+| (?P<name>[A-Za-z_]\w*)
+""", re.VERBOSE)
+
+# each pattern matches from just after the open quote through its close
+closes = { quote: re.compile(r'(?:\\.|[^\\])*?' + re.escape(quote))
+           for quote in ("'''", '"""', "'", '"') }
+
+def continued(line, quote):
+    'Return state after line that ends inside a string opened by quote'
+    if len(quote) == 3:
+        return quote
+    nslash = len(line) - len(line.rstrip('\\'))
+    return quote if nslash % 2 else '' # odd: backslash continues the line
+
+def lex(line, state):
+    """
+    Return list of spans (start, end, attrs) to color in line, without its
+    final newline, and the state at the start of the next line.
+    state is '' in code, or the quote of a string open at the start of line.
+    """
+    spans = []
+    pos = 0
+    quote = state
+    if quote: # start inside a string
+        m = closes[quote].match(line)
+        if not m:
+            return [(0, len(line), colors['string'])], continued(line, quote)
+        spans.append((0, m.end(), colors['string']))
+        pos = m.end()
+    defining = False # previous name was def or class
+    while True:
+        m = token.search(line, pos)
+        if not m:
+            return spans, ''
+        kind = m.lastgroup
+        if kind == 'string':
+            quote = m.group('quote')
+            close = closes[quote].match(line, m.end())
+            if not close:
+                spans.append((m.start(), len(line), colors['string']))
+                return spans, continued(line, quote)
+            spans.append((m.start(), close.end(), colors['string']))
+            pos = close.end()
+            continue
+        word = m.group()
+        if kind == 'name' and word in keywords:
+            spans.append((m.start(), m.end(), colors['keyword']))
+        elif kind == 'name' and defining:
+            spans.append((m.start(), m.end(), colors['defname']))
+        elif kind != 'name':
+            spans.append((m.start(), m.end(), colors[kind]))
+        defining = word in ('def', 'class')
+        pos = m.end()
+
+def cells(line, spans):
+    'Return screen cells for line with attributes from spans, expand tabs'
+    attrs = [''] * len(line)
+    for start, end, a in spans:
+        attrs[start:end] = [a] * (end - start)
+    linecells = []
+    for ch, a in zip(line, attrs):
+        if ch == '\t':
+            linecells.extend([(' ', a)] * (8 - len(linecells) % 8))
+        else:
+            linecells.append((ch, a))
+    return linecells
+
+class Highlighter():
+    """
+    Syntax colors of the lines in buffer, a sked buffer list or Rope.
+    Usage: colors = Highlighter(buffer), colors.spans(i) for line i,
+    and colors.update(start, nold, lines) after each change, see sked.observe.
+    """
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.states = [''] # state at start of each line lexed, and one more
+        self.lexed = [] # spans of each line lexed, from the top
+
+    def spans(self, iline):
+        'Return spans for line iline, lex down to it if not lexed yet'
+        while len(self.lexed) <= iline < len(self.buffer):
+            i = len(self.lexed)
+            spans, state = lex(self.buffer[i].rstrip('\n'), self.states[i])
+            self.lexed.append(spans)
+            self.states.append(state)
+        return self.lexed[iline] if iline < len(self.lexed) else []
+
+    def update(self, start, nold, lines):
+        """
+        After nold lines at start were replaced by lines, lex the new lines
+        and the lines after them until one starts in the same state as
+        before.  Return index of first line after those lexed: the colors of
+        lines start up to there might have changed.
+        """
+        n = len(self.lexed)
+        if start + nold > n: # change reaches past the lines lexed so far
+            del self.lexed[start:], self.states[start+1:]
+            return start
+        old = self.states[start+nold] # state at start of first line after
+        self.lexed[start:start+nold] = [None] * len(lines)
+        self.states[start+1:start+nold+1] = [None] * len(lines)
+        end = start + len(lines) # first line after the new lines
+        iline = start
+        while iline < len(self.lexed):
+            if iline >= end and self.states[iline] == old:
+                break # same state as before, so same colors from here on
+            if iline >= end:
+                old = self.states[iline+1] # before we replace it
+            self.lexed[iline], self.states[iline+1] = lex(
+                self.buffer[iline].rstrip('\n'), self.states[iline])
+            iline += 1
+        return iline
@@ -0,0 +1,154 @@
+"""
+journal.py - Write-ahead journal of changes to sked buffers, so unsaved
+             buffers can be recovered after a crash or a lost terminal.
+
+While the journal is running, sked.splice records every change to a buffer:
+the file name, the range of lines replaced and the new lines.  sked also
+records when a file is loaded (e), saved (w) or its buffer killed (k).
+record only appends a tuple to a list in memory, so it adds almost nothing
+to each keystroke.  A background thread wakes every interval seconds,
+appends the new records to the journal file as lines of JSON, then fsyncs
+the file, so a crash loses at most the last interval of typing.
+
+To recover, sked.recover loads each file that has unsaved changes in the
+journal, the last saved version, then replays the changes made since.
+
+When no buffer has unsaved changes, the thread empties the journal file
+instead of appending to it, so the journal does not grow without limit.
+
+See NOTES.txt for more notes.
+"""
+
+import os, json, time, atexit, itertools, threading
+
+path = os.path.join(os.path.expanduser('~'), '.sked_journal')
+interval = 1.0 # seconds between writes to journal file, each with fsync
+
+# Define and initialize global variables used by this module,
+# but only the *first* time this module is imported.
+try:
+    _ = running # if this variable is defined, module was already imported
+except:
+    running = False # True when journal is started, sked.splice checks this
+    pending = []    # records not yet written to journal file
+    dirty = set()   # names of files with unsaved changes in journal
+    unrecovered = set() # names of files with changes from last session
+    lock = threading.Lock() # guards pending and dirty
+    writing = threading.Lock() # guards journal file
+    fd = None       # journal file, open for append
+    marks = itertools.count() # ids of marks, see mark
+
+def record(op, fname, *args):
+    """
+    Record op on file fname: 's' splice with args start, stop, lines,
+    'e' loaded, 'w' saved, 'k' buffer killed, 'm' mark with arg id.
+    'w' can have args id, unchanged: saved contents at mark id, and
+    unchanged is True if buffer did not change since.  Called by sked.
+    """
+    fname = os.path.abspath(fname) # sked filenames may be relative
+    with lock:
+        pending.append((op, fname) + args)
+        if op == 's': dirty.add(fname)
+        elif op == 'm': pass
+        elif op != 'w' or not args or args[1]: dirty.discard(fname)
+
+def mark(fname):
+    """
+    Record mark where sked.w copies buffer for fname to save it in a thread,
+    return mark id.  Edits can be recorded before the save finishes, then
+    record('w', fname, id, ...) says the save includes only edits before it.
+    """
+    id = next(marks)
+    record('m', fname, id)
+    return id
+
+def discard(fname):
+    'Discard the unsaved changes to fname from the last session'
+    fname = os.path.abspath(fname)
+    unrecovered.discard(fname)
+    record('k', fname)
+
+def flush():
+    'Write pending records to journal file and fsync, or empty it if clean'
+    global pending
+    with writing:
+        with lock:
+            batch, pending = pending, []
+            clean = not dirty
+        if not batch or not fd:
+            return
+        if clean: # every file is saved, no record in the journal is needed
+            fd.truncate(0) # append mode, so next write starts at 0
+        else:
+            fd.write(''.join(json.dumps(r) + '\n' for r in batch))
+        fd.flush()
+        os.fsync(fd.fileno())
+
+def flusher():
+    'Run in background thread, flush at intervals while journal is running'
+    while running:
+        time.sleep(interval)
+        flush()
+
+def unsaved():
+    """
+    Read journal file, return dict from name of each file that has
+    unsaved changes to list of (start, stop, lines) since it was saved.
+    """
+    changes = {}
+    saving = {} # (name, mark id) -> N of changes to name before mark
+    try:
+        with open(path) as jfd:
+            for line in jfd:
+                try:
+                    op, name, *args = json.loads(line)
+                except ValueError: # incomplete line, write was cut off
+                    continue
+                if op == 's':
+                    changes.setdefault(name, []).append(args)
+                elif op == 'm':
+                    saving[(name, args[0])] = len(changes.get(name, []))
+                elif op == 'w' and (name, args[0] if args else None) in saving:
+                    # file on disk is base for changes after the mark
+                    n = saving.pop((name, args[0]))
+                    changes[name] = changes.get(name, [])[n:]
+                    if not changes[name]: del changes[name]
+                else: # 'e' 'w' 'k', file on disk is base for later changes
+                    changes.pop(name, None)
+                    saving = { key: n for key, n in saving.items()
+                               if key[0] != name }
+    except FileNotFoundError:
+        pass
+    return changes
+
+def start():
+    """
+    Start journal, keep unrecovered changes from any previous session.
+    Print names of files that have them, sked.recover() recovers them.
+    """
+    global running, fd, dirty, unrecovered
+    if running:
+        return
+    changes = unsaved()
+    for fname in changes:
+        print(f'{fname} has unsaved changes in journal, recover() them\n\r',
+              end='')
+    dirty = set(changes) # keep these in the journal until they are saved
+    unrecovered = set(changes) # sked.e won't load these, see discard
+    fd = open(path, 'a')
+    if fd.tell(): fd.write('\n') # end any incomplete line, write was cut off
+    running = True
+    threading.Thread(target=flusher, daemon=True).start()
+
+def stop():
+    'Write any pending records and stop the journal'
+    global running, fd
+    if not running:
+        return
+    running = False
+    flush()
+    with writing:
+        fd.close()
+        fd = None
+
+atexit.register(stop) # don't lose the last interval at exit
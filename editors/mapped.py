@@ -0,0 +1,212 @@
+"""
+mapped.py - Load a very large file into a Rope buffer without reading it,
+            by mapping the file into memory and decoding lines on demand.
+
+The file is divided into blocks of about blocksize bytes, each ending at
+the end of a line.  We only count the lines in each block, which runs at
+memory speed and creates no Python strings.  load counts the first block
+and returns, a Counter thread counts the rest and the Rope appends them as
+they are counted.  Each block becomes one chunk in the Rope, a Lines
+placeholder that decodes the block when the editor reads any line in it,
+for example when edsel.update_lines shows it in a window, but keeps the
+lines only when they are edited.
+
+The View class here is a read-only buffer for sked.view.  It finds lines
+through a sparse index, the number of the first line in each block, and
+keeps only a few recently used blocks decoded.
+
+See NOTES.txt for more notes.
+"""
+
+import mmap, bisect, itertools, collections, threading
+import rope
+
+blocksize = 2**20 # bytes, about, in each block. Each block is one Rope chunk.
+encoding = 'utf-8'
+cachesize = 8 # N of decoded blocks to keep, see Lines.lines
+cache = collections.OrderedDict() # Lines -> its lines, most recent last
+cachelock = threading.Lock() # sked.w might decode in another thread
+
+def decode(data):
+    """
+    Return list of lines in data (bytes), each ending with \\n, like readlines
+    Last line in the file might not end with \\n.  Undecodable bytes are
+    kept as they are, so sked.w writes them back unchanged.
+    """
+    text = data.decode(encoding, errors='surrogateescape')
+    if '\r' in text: text = text.replace('\r\n', '\n') # like readlines
+    lines = text.split('\n')
+    last = lines.pop() # '' if data ends with \n, otherwise incomplete line
+    lines = [ line + '\n' for line in lines ]
+    if last: lines.append(last)
+    return lines
+
+class Lines():
+    """
+    Placeholder for the lines in one block of a mapped file.
+    Rope calls lines to read them, and load to replace this with a list of
+    lines when one of them is edited.
+    """
+    def __init__(self, mm, start, end, nlines):
+        self.mm = mm        # mmap object, file contents
+        self.start = start  # byte offset of start of block in file
+        self.end = end      # byte offset just past end of block
+        self.nlines = nlines
+
+    def __len__(self):
+        return self.nlines
+
+    def __iter__(self):
+        'Iterate over lines without keeping them, so writing a file is cheap'
+        return iter(self.lines())
+
+    def lines(self):
+        """
+        Return list of lines, do not change it.  Keep only the cachesize
+        most recently used blocks, so paging through a huge file or
+        searching a block in several segments decodes each block once.
+        """
+        with cachelock:
+            lines = cache.get(self)
+            if lines is not None:
+                cache.move_to_end(self)
+                return lines
+        lines = decode(self.mm[self.start:self.end])
+        with cachelock:
+            cache[self] = lines
+            while len(cache) > cachesize:
+                cache.popitem(last=False) # least recently used
+        return lines
+
+    def load(self):
+        'Return new list of lines, to replace this placeholder in the Rope'
+        with cachelock:
+            cache.pop(self, None) # Rope keeps the lines now
+        return list(self.lines())
+
+def blocks(mm):
+    'Generate Lines placeholders, one for each block in mm'
+    start, size = 0, len(mm)
+    while start < size:
+        end = mm.find(b'\n', min(start + blocksize, size) - 1)
+        end = size if end < 0 else end + 1 # end of line, or end of file
+        data = mm[start:end]
+        nlines = data.count(b'\n') + (0 if data.endswith(b'\n') else 1)
+        yield Lines(mm, start, end, nlines)
+        start = end
+
+def mapfile(fname):
+    'Return mmap of file fname, or None if the file is empty'
+    with open(fname, 'rb') as fd:
+        if not fd.seek(0, 2): # empty file, can't map zero bytes
+            return None
+        return mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) # own fd
+
+class Counter():
+    """
+    Count the blocks of a mapped file in a thread, for Rope.absorb.
+    The first block is counted at once, so the editor can show it.
+    """
+    def __init__(self, mm):
+        self.blocks = [] # Lines placeholders counted so far, thread appends
+        self.done = threading.Event() # set when all blocks are counted
+        self.more = blocks(mm)
+        self.blocks.extend(itertools.islice(self.more, 1))
+        threading.Thread(target=self.count, daemon=True).start()
+
+    def count(self):
+        try:
+            for block in self.more:
+                self.blocks.append(block)
+        finally:
+            self.done.set()
+
+    def take(self, n, wait=False):
+        """
+        Return list of blocks counted after the first n, and True if there
+        will be no more.  If wait, first wait until all blocks are counted.
+        """
+        if wait: self.done.wait()
+        finished = self.done.is_set() # before len, so no block is missed
+        return self.blocks[n:], finished
+
+def load(fname):
+    """
+    Return Rope buffer for file fname, with dummy line at index 0 like sked.
+    The file is mapped but not read; lines are decoded when they are needed.
+    Return at once, the Rope grows as the Counter counts the blocks.
+    """
+    buffer = rope.Rope.fromchunks([['\n']])
+    mm = mapfile(fname)
+    if mm:
+        buffer.more = Counter(mm)
+        buffer.absorb()
+    return buffer
+
+def counting(buffer):
+    'Return True if the lines of mapped buffer are still being counted'
+    return isinstance(buffer, rope.Rope) and buffer.more is not None
+
+class View():
+    """
+    Read-only list of the lines in mapped file fname, for sked.view.
+    Supports buffer[i], slicing, len and iteration, but no assignment.
+    Like a sked buffer, the first line of the file is at index 1.
+    """
+    cachesize = 8 # N of decoded blocks to keep
+
+    def __init__(self, fname):
+        mm = mapfile(fname)
+        self.blocks = list(blocks(mm)) if mm else []
+        # sparse index: starts[k] is the index of the first line in block k
+        self.starts = list(itertools.accumulate(
+            (len(block) for block in self.blocks), initial=1))
+        self.length = self.starts[-1]
+        self.cache = collections.OrderedDict() # block index -> lines
+
+    def block(self, k):
+        'Return list of lines in block k, decode it if it is not in cache'
+        if k in self.cache:
+            self.cache.move_to_end(k)
+        else:
+            self.cache[k] = self.blocks[k].load()
+            if len(self.cache) > self.cachesize:
+                self.cache.popitem(last=False) # least recently used
+        return self.cache[k]
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        'Iterate over all lines, but do not keep them'
+        return itertools.chain(['\n'], *self.blocks)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(self.length)
+            if step != 1:
+                return [ self[j] for j in range(start, stop, step) ]
+            lines = ['\n'] if start == 0 < stop else []
+            start = max(start, 1)
+            while start < stop: # copy lines from each block in the slice
+                k = bisect.bisect_right(self.starts, start) - 1
+                n = min(stop, self.starts[k+1]) - start
+                j = start - self.starts[k]
+                lines += self.block(k)[j:j+n]
+                start += n
+            return lines
+        if i < 0: i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError('View index out of range')
+        if i == 0:
+            return '\n' # dummy line, like sked buffer
+        k = bisect.bisect_right(self.starts, i) - 1
+        return self.block(k)[i - self.starts[k]]
+
+    def __repr__(self):
+        return f'View({self.length} lines in {len(self.blocks)} blocks)'
+
+def is_mapped(buffer):
+    'Return True if some lines in buffer are still in a mapped file'
+    return (isinstance(buffer, rope.Rope) and
+            any(isinstance(chunk, Lines) for chunk in buffer.chunks))
@@ -5,7 +5,7 @@ pmacs might mean 'Python emacs' but actually means 'partly inspired by emacs'
 or maybe 'poor imitation of emacs'.
 """
 
-import terminal, key, keyseq, display, edsel, dmacs
+import terminal, key, keyseq, display, screen, edsel, dmacs
 import sked as ed, editline as el
 
 # Define and initialize global variables used by pmacs functions,
@@ -20,6 +20,10 @@ except:
 
 running = True # rpm main loop is running, set False to exit.
 
+# editline commands that only move point, allowed in read-only buffers
+motion_cmds = (el.move_beginning, el.move_end, el.backward_char,
+               el.forward_char, el.forward_word, el.backward_word)
+
 # helper functions
 
 def reset_point():
@@ -28,10 +32,35 @@ def reset_point():
     if ed.point > linelen:
         ed.point = linelen - 1 # -1 to put point before final \n
 
+def edit_line(keycode):
+    'Run editline command for keycode on line at dot, update line and point'
+    if ((edsel.full_width() and ed.bufname not in edsel.highlighting)
+        or not (display.frames and display.coalesce)):
+        line, ed.point = el.runcmd(keycode, ed.buffer[ed.dot], ed.point,
+                                   start_col)
+        if line != ed.buffer[ed.dot]: # editline wrote on display, not on screen
+            screen.forget(edsel.wline(ed.dot))
+        ed.setline(ed.dot, line) # only changes buffer if line changed
+        edsel.drawn(ed.dot)
+        if edsel.dirty: # other windows show this buffer
+            edsel.repaint()
+            restore_cursor_to_window()
+        return
+    # Window beside others: editline would write across the whole line,
+    # and it writes without syntax colors, so discard what it writes and
+    # draw the line in the window with screen.
+    with display.discarded():
+        line, ed.point = el.runcmd(keycode, ed.buffer[ed.dot], ed.point,
+                                   start_col)
+    ed.setline(ed.dot, line)
+    edsel.repaint() # this line here, and in other windows that show it
+    restore_cursor_to_window()
+
 def restore_cursor_to_window():
     # reset_point() # no longer needed here, each pmacs fcn maintains ed.point
     # point+1 to make put_cursor call consistent with editline move_to_column
-    display.put_cursor(edsel.wline(ed.dot), ed.point + 1)
+    screen.flush()
+    display.put_cursor(edsel.wline(ed.dot), edsel.winleft + ed.point)
 
 # Some functions do not use keycode arg but kecallers ycmd and runcmd repass it
 
@@ -56,14 +85,10 @@ def open_line(keycode):
     """
     suffix = ed.buffer[ed.dot][ed.point:] # including final \n
     # Keep prefix on dot.  Calls el.kill_line, thanks to key.C_k, not keycode
-    ed.buffer[ed.dot], ed.point = el.runcmd(key.C_k, ed.buffer[ed.dot],
-                                             ed.point, start_col)
-    ed.buffer[ed.dot+1:ed.dot+1] = [ suffix ] # insert suffix line after dot
+    edit_line(key.C_k)
+    ed.splice(ed.dot+1, ed.dot+1, [ suffix ]) # insert suffix line after dot
     ed.dot = ed.dot + 1
-    if edsel.in_window(ed.dot):
-        edsel.update_below(ed.dot)
-    else:
-        edsel.recenter()
+    edsel.display_changes() # repaint the suffix line and the lines below
     ed.point = 0 # start of new suffix line
     restore_cursor_to_window()
 
@@ -82,8 +107,7 @@ def delete_backward_char(keycode):
     """
     if ed.point > 0:
         # Calls el.delete_backward_char, thanks to keycode DEL key.bs
-        ed.buffer[ed.dot], ed.point = el.runcmd(keycode, ed.buffer[ed.dot],
-                                                ed.point, start_col) 
+        edit_line(keycode)
     else: 
         join_prev() # see above
         restore_cursor_to_window()
@@ -100,8 +124,7 @@ def delete_char(keycode):
     """
     if ed.point < len(ed.buffer[ed.dot].rstrip('\n')):
         # Calls el.delete_char, thanks to keycode C_d
-        ed.buffer[ed.dot], ed.point = el.runcmd(keycode, ed.buffer[ed.dot],
-                                                ed.point, start_col)
+        edit_line(keycode)
     else:
         join_next() # see above
         restore_cursor_to_window()
@@ -138,8 +161,7 @@ def kill_line(keycode):
         ed.killed.remove('\n') # remove '\n' line
     # inline kill line:
     elif inline: # weaker condition, must follow previous stronger if...
-        ed.buffer[ed.dot], ed.point = el.runcmd(keycode, ed.buffer[ed.dot],
-                                                ed.point, start_col)
+        edit_line(keycode)
     # kill line that is part of a multiline sequence:
     elif not inline:
         edsel.d(None,None,True) # consecutive C_k, append line to killed buffer
@@ -156,8 +178,7 @@ def yank(keycode):
     Yank entire line(s) or yank word(s) within a line, depending on inline
     """
     if inline:
-        ed.buffer[ed.dot], ed.point = el.runcmd(keycode, ed.buffer[ed.dot], 
-                                                 ed.point, start_col)
+        edit_line(keycode)
     else:
         dmacs.runcmd(keycode) # keycode is C_y here
         restore_cursor_to_window()
@@ -171,6 +192,17 @@ def append(keycode):
     dmacs.runcmd(key.cr) # calls dmacs append, which enters append mode.
     restore_cursor_to_window()
 
+def undo(keycode):
+    'Undo most recent command, or run of characters typed on one line'
+    edsel.u()
+    reset_point() # line at dot might be shorter now
+    restore_cursor_to_window()
+
+def redo(keycode):
+    edsel.redo()
+    reset_point()
+    restore_cursor_to_window()
+
 keymap = {
     key.C_n: next_line,
     key.C_p: prev_line,
@@ -183,24 +215,35 @@ keymap = {
     key.C_y: yank,
     key.C_l: refresh,
     key.C_x + key.C_a: append, # Enter dmacs append mode, exit with .
+    key.C_underscore: undo, # also ^/ on many terminals
+    key.C_x + 'u': undo,
+    key.C_M_underscore: redo,
     # arrow keys, send ANSI escape sequences
     key.down: next_line,
     key.up: prev_line,}
 
+# Commands in keymap that don't change the buffer, so they work in read-only
+# buffers opened by view.  Other keys that don't edit, like C-v, M-v, C-s
+# and C-r, run dmacs commands, and sked.writable stops any that would edit.
+view_cmds = (next_line, prev_line, refresh)
+
 def keycmd(keycode):
     """
     Execute a single pmacs key command: dispatch on key k, run function
     """
     cmd = keymap[keycode]
+    if ed.readonly and cmd not in view_cmds:
+        display.putstr(key.bel) # can't edit read-only buffer
+        return
     cmd(keycode)
     dmacs.prev_cmd = cmd
     # Note: A few cmd call el.runcmd we believe we needn't update el.prev_cmd
 
 def clear_marker():
     edsel.put_marker(ed.dot, display.clear)
-    display.put_cursor(edsel.tlines, 1)
+    edsel.restore_cursor_to_cmdline()
 
-def put_no_marker(bufline, attribs): 
+def put_no_marker(bufline, attribs, win=None):
     'Assign to edsel.put_marker to suppress marker while running pmacs'
     pass
 
@@ -222,16 +265,21 @@ def runcmd(c):
     global running, inline
     k = keyseq.keyseq(c)
     if k: # keyseq returns '' if key sequence is not complete
+        # Undo each command separately, but a run of typing all together
+        if not (k in el.printing_chars and dmacs.prev_cmd == el.insert_char):
+            ed.checkpoint()
         if k == key.M_x:
             running = False
         elif k in keymap:
             keycmd(k)
         elif k in el.printing_chars or k in el.keymap:
+            if ed.readonly and el.keymap.get(k) not in motion_cmds:
+                display.putstr(key.bel) # can't edit read-only buffer
+                return
             el.prev_cmd = dmacs.prev_cmd
-            if ed.S() < 1: ed.buffer = ['\n','\n'] # initialize empty buffer   
+            if ed.S() < 1: ed.splice(1, 1, ['\n']) # initialize empty buffer
             if ed.dot == 0: ed.dot = 1 # buffer[0] is always dummy '\n'
-            ed.buffer[ed.dot], ed.point = el.runcmd(k, ed.buffer[ed.dot],
-                                          ed.point, start_col)
+            edit_line(k) # read-only allows motion only, line doesn't change
             dmacs.prev_cmd = el.prev_cmd
             # key.C_k and inline are handled in kill_line, above
             if k in (key.M_d, key.C_u): # M_d kill_word, C_u discard line 
@@ -253,7 +301,8 @@ def rpm():
     setup()
     while running:
         c = terminal.getchar() # blocking
-        runcmd(c)
+        with display.frame(): # one write for the whole command
+            runcmd(c)
     restore() 
 
 def pm():
@@ -0,0 +1,264 @@
+"""
+rope.py - Rope, a list of lines stored in chunks, so that editing a very
+          large buffer does not copy the whole buffer on every edit.
+
+A Rope can be used for sked.buffer in place of the usual Python list.
+It supports the list operations the editors use: buffer[i], buffer[i] = s,
+slicing, slice assignment, del, len, append, extend, insert and iteration.
+Slicing returns an ordinary list, so code like ''.join(buffer[start:end+1])
+works unchanged.
+
+The lines are kept in a list of chunks, each chunk is a short Python list.
+A Fenwick tree (binary indexed tree) of the chunk lengths finds the chunk
+that holds any line in O(log n) steps.  An edit only splices the one or two
+chunks it touches.  Chunks that grow too large are split, chunks that shrink
+too small are merged with a neighbor, then the tree is rebuilt.
+
+A chunk can also be a placeholder for lines that are not loaded yet, any
+object with __len__, __iter__, a load method that returns a new list of its
+lines, and a lines method that returns the lines without keeping them.
+Reading lines only calls lines, the Rope keeps a placeholder until one of
+its lines is edited, then replaces it with the list from load.  A Rope can
+also grow at the end while another thread finds more chunks, see absorb.
+mapped.py uses this to load huge files lazily.
+
+See NOTES.txt for more notes.  See ropebench.py to compare with list.
+"""
+
+import itertools
+
+class Rope():
+    """
+    List of lines stored in chunks, with O(log n) index, insert and delete.
+    Usage:  buffer = Rope(['\\n'] + fd.readlines())  then use it like a list.
+    """
+    chunksize = 512 # lines in each chunk when chunks are (re)built
+    more = None # object still finding chunks to append, see absorb
+    nmore = 0   # N of chunks already taken from more
+
+    def __init__(self, lines=(), chunksize=None):
+        if chunksize: self.chunksize = chunksize
+        lines = list(lines)
+        n = self.chunksize
+        self.chunks = [ lines[i:i+n] for i in range(0, len(lines), n) ] or [[]]
+        self.reindex()
+
+    @classmethod
+    def fromchunks(cls, chunks):
+        'Return Rope made from chunks, lists of lines or placeholders'
+        r = cls()
+        r.chunks = [ chunk for chunk in chunks if len(chunk) ] or [[]]
+        r.reindex()
+        return r
+
+    def chunk(self, k):
+        'Return chunk k as a list to edit, first load it if it is a placeholder'
+        chunk = self.chunks[k]
+        if type(chunk) is not list:
+            chunk = self.chunks[k] = chunk.load()
+        return chunk
+
+    def read(self, k):
+        'Return lines in chunk k to read only, do not load a placeholder'
+        chunk = self.chunks[k]
+        return chunk if type(chunk) is list else chunk.lines()
+
+    def absorb(self, wait=False):
+        """
+        Append chunks found by self.more since the last call, if wait first
+        wait until it has found all of them.  more.take(n, wait) returns the
+        list of chunks found after the first n, and True if it is finished.
+        """
+        chunks, finished = self.more.take(self.nmore, wait)
+        if finished: self.more = None
+        if chunks:
+            self.nmore += len(chunks)
+            self.chunks += [ chunk for chunk in chunks if len(chunk) ]
+            self.reindex()
+
+    # Fenwick tree of chunk lengths
+
+    def reindex(self):
+        'Rebuild the Fenwick tree after chunks are added, split or removed'
+        nchunks = len(self.chunks)
+        tree = [0]*(nchunks+1) # tree[0] is never used, like buffer[0]
+        for k, chunk in enumerate(self.chunks, 1):
+            tree[k] += len(chunk)
+            parent = k + (k & -k)
+            if parent <= nchunks: tree[parent] += tree[k]
+        self.tree = tree
+        self.length = sum(len(chunk) for chunk in self.chunks)
+        self.top = 1 << (nchunks.bit_length() - 1) if nchunks else 0
+
+    def grow(self, k, delta):
+        'Add delta to the length of chunk k, which did not move'
+        self.length += delta
+        k += 1 # tree is one-based
+        while k < len(self.tree):
+            self.tree[k] += delta
+            k += k & -k
+
+    def locate(self, i):
+        """
+        Return k, j: index of chunk that holds line i, index of line i in chunk
+        For i == len(self), return position just after the last line.
+        """
+        k, rest, step = 0, i, self.top
+        while step: # descend the tree, skip whole subtrees of chunks before i
+            if k + step < len(self.tree) and self.tree[k+step] <= rest:
+                k += step
+                rest -= self.tree[k]
+            step >>= 1
+        if k == len(self.chunks): # i == len(self), past the end
+            k -= 1
+            rest = len(self.chunks[k])
+        return k, rest
+
+    # Restructure chunks
+
+    def split(self, k):
+        'Split chunk k into chunks of chunksize lines'
+        chunk, n = self.chunk(k), self.chunksize
+        self.chunks[k:k+1] = [ chunk[i:i+n] for i in range(0, len(chunk), n) ]
+        self.reindex()
+
+    def merge(self, k):
+        'Merge small chunk k into a neighbor, remove it if empty'
+        if len(self.chunks) == 1:
+            return
+        if self.chunks[k]:
+            neighbor = k-1 if k > 0 else k+1
+            first, last = min(k, neighbor), max(k, neighbor)
+            self.chunks[first:last+1] = [ self.chunk(first) + self.chunk(last) ]
+            if len(self.chunks[first]) > 2*self.chunksize:
+                self.split(first) # reindexes
+                return
+        else:
+            del self.chunks[k]
+        self.reindex()
+
+    # Editing
+
+    def splice(self, start, stop, lines):
+        """
+        Replace lines start up to (not including) stop with lines, like
+        self[start:stop] = lines but only touch the chunks that change.
+        """
+        ndelete = max(stop - start, 0)
+        k, j = self.locate(start)
+        small = [] # chunks that got too small, merge them later
+        while ndelete:
+            n = min(len(self.chunks[k]) - j, ndelete)
+            if n == len(self.chunks[k]): # whole chunk, no need to load it
+                self.chunks[k] = []
+            else:
+                del self.chunk(k)[j:j+n]
+            chunk = self.chunks[k]
+            self.grow(k, -n)
+            ndelete -= n
+            if len(chunk) < max(self.chunksize // 4, 1): small.append(k)
+            k, j = k+1, 0
+        for k in reversed(small): # reversed, so indexes of others don't change
+            if len(self.chunks[k]) < max(self.chunksize // 4, 1): self.merge(k)
+        if lines:
+            k, j = self.locate(start) # after merge, chunks might have moved
+            chunk = self.chunk(k)
+            chunk[j:j] = lines
+            self.grow(k, len(lines))
+            if len(chunk) > 2*self.chunksize: self.split(k)
+
+    def snapshot(self):
+        'Return copy of this Rope, later edits to either do not change the other'
+        r = type(self).fromchunks([ chunk[:] if type(chunk) is list else chunk
+                                    for chunk in self.chunks ])
+        r.chunksize = self.chunksize
+        r.more, r.nmore = self.more, self.nmore # copy grows in its own thread
+        return r
+
+    def insert(self, i, line):
+        self.splice(i, i, [ line ])
+
+    def append(self, line):
+        'Append line at the end, usually without locating or reindexing'
+        if self.more: self.absorb(wait=True)
+        k = len(self.chunks) - 1
+        self.chunk(k).append(line)
+        self.grow(k, 1)
+        if len(self.chunks[k]) > 2*self.chunksize: self.split(k)
+
+    def extend(self, lines):
+        lines = list(lines)
+        if self.more: self.absorb(wait=True)
+        self.splice(self.length, self.length, lines)
+
+    # List protocol
+
+    def index_valid(self, i):
+        'Return i as index from start, raise IndexError like list if invalid'
+        if self.more and not 0 <= i < self.length:
+            self.absorb(wait=True) # i is past the lines found so far
+        if i < 0: i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError('Rope index out of range')
+        return i
+
+    def slice_range(self, s):
+        'Return start, stop for slice s, only contiguous slices are supported'
+        if self.more: # slice to the end, or from it, needs the real end
+            ends = (s.start or 0, -1 if s.stop is None else s.stop)
+            self.absorb(wait=not all(0 <= i < self.length for i in ends))
+        start, stop, step = s.indices(self.length)
+        if step != 1:
+            raise ValueError('Rope slice step must be 1')
+        return start, max(start, stop)
+
+    def islice(self, start, stop):
+        'Iterate over lines start up to stop, do not load placeholders'
+        k, j = self.locate(start)
+        n = stop - start
+        while n > 0 and k < len(self.chunks):
+            lines = self.read(k)[j:j+n]
+            yield from lines
+            n -= len(lines)
+            k, j = k+1, 0
+
+    def __len__(self):
+        if self.more: self.absorb()
+        return self.length
+
+    def __iter__(self):
+        if self.more: self.absorb(wait=True)
+        return itertools.chain.from_iterable(self.chunks)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop = self.slice_range(i)
+            lines = []
+            if start == stop:
+                return lines
+            k, j = self.locate(start)
+            while len(lines) < stop - start:
+                lines += self.read(k)[j:j + stop - start - len(lines)]
+                k, j = k+1, 0
+            return lines
+        k, j = self.locate(self.index_valid(i))
+        return self.read(k)[j]
+
+    def __setitem__(self, i, value):
+        if isinstance(i, slice):
+            start, stop = self.slice_range(i)
+            self.splice(start, stop, list(value))
+        else:
+            k, j = self.locate(self.index_valid(i))
+            self.chunk(k)[j] = value
+
+    def __delitem__(self, i):
+        if isinstance(i, slice):
+            start, stop = self.slice_range(i)
+        else:
+            start = self.index_valid(i)
+            stop = start + 1
+        self.splice(start, stop, [])
+
+    def __repr__(self):
+        return f'Rope({self.length} lines in {len(self.chunks)} chunks)'
@@ -0,0 +1,63 @@
+"""
+ropebench.py - Compare Rope with list as the sked buffer engine on large
+               synthetic buffers.
+
+...$ python3 ropebench.py          # default 100000, 500000, 1000000 lines
+...$ python3 ropebench.py 2000000  # or give the buffer sizes to try
+
+Each operation is repeated at random positions in the buffer, the same
+positions for both engines.  The table shows microseconds per operation.
+The operations are the ones the editors do: index a line (display), replace
+a line (pmacs typing), insert and delete a few lines (a, d, y, open_line),
+copy a window-sized slice (edsel update_lines), and append at the end (writer).
+"""
+
+import sys, time, random
+from rope import Rope
+
+nops = 2000 # operations of each kind, at random positions
+
+def synthetic(nlines):
+    'Return list of nlines lines like a log file, with buffer[0] dummy line'
+    return ['\n'] + [ f'{i:08d} INFO synthetic log line with some text\n'
+                      for i in range(1, nlines) ]
+
+def timed(f, positions):
+    'Call f at each position, return microseconds per call'
+    t0 = time.perf_counter()
+    for i in positions: f(i)
+    return 1e6 * (time.perf_counter() - t0) / len(positions)
+
+def bench(engine, lines, positions):
+    'Return dict from operation name to microseconds per operation'
+    buffer = engine(lines)
+    def index(i): buffer[i]
+    def replace(i): buffer[i] = buffer[i][:-1] + 'x\n'
+    def insert(i): buffer[i:i] = ['inserted\n', 'lines\n']
+    def delete(i): buffer[i:i+2] = []
+    def window(i): buffer[i:i+40]
+    def append(i): buffer.append('appended\n')
+    return { f.__name__: timed(f, positions)
+             for f in (index, replace, insert, delete, window, append) }
+
+def main(sizes):
+    random.seed(0)
+    for nlines in sizes:
+        lines = synthetic(nlines)
+        positions = [ random.randrange(1, nlines-2) for i in range(nops) ]
+        t0 = time.perf_counter()
+        results = { 'list': bench(list, lines, positions) }
+        tlist = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        results['Rope'] = bench(Rope, lines, positions)
+        trope = time.perf_counter() - t0
+        print(f'\n{nlines} lines, {nops} ops each, usec/op')
+        print('%-8s' % 'engine' +
+              ''.join('%10s' % op for op in results['list']) + '%10s' % 'total s')
+        for engine, t in (('list', tlist), ('Rope', trope)):
+            print('%-8s' % engine +
+                  ''.join('%10.2f' % us for us in results[engine].values()) +
+                  '%10.2f' % t)
+
+if __name__ == '__main__':
+    main([ int(arg) for arg in sys.argv[1:] ] or [100000, 500000, 1000000])
@@ -0,0 +1,57 @@
+"""
+scrollcheck.py - Check that when dot moves one line past the edge of the
+                 window, edsel scrolls one line and draws only that line,
+                 not half a window as recenter would.
+
+...$ python3 scrollcheck.py   # in the editors directory, in a terminal
+
+Output goes to a counter, not the terminal.  For each move, count the
+display lines that screen.flush sends: the new line, which now has the
+marker, the row the marker left, and the status line.  Print the counts,
+then fail if any one-line move sends more than maxrows lines.
+"""
+
+import sys
+import display, screen, edsel
+
+maxrows = 3 # new line with the marker, old marker row, status line
+
+class Sink():
+    'Stand in for display.tty, keep the output from the terminal'
+    def write(self, s): pass
+    def flush(self): pass
+
+sent = [] # display line numbers that screen.flush sent, see diff
+original_diff = screen.diff
+
+def diff(iline, old, new, at):
+    'Like screen.diff, also record line iline if anything is sent'
+    s, at = original_diff(iline, old, new, at)
+    if s: sent.append(iline)
+    return s, at
+
+def moves(f, n):
+    'Call f n times, return list of N of display lines sent after each'
+    counts = []
+    for _ in range(n):
+        sent.clear()
+        f()
+        counts.append(len(sent))
+    return counts
+
+def main():
+    display.tty = Sink()
+    display.nonblocking = False # no event loop here, write at once
+    screen.diff = diff
+    edsel.win(12)
+    edsel.e('test/lines40.txt')
+    edsel.p(edsel.buftop + edsel.wheight - 2) # dot on the bottom line
+    down = moves(edsel.l, 5)  # each move scrolls up one line
+    edsel.p(edsel.buftop)     # dot on the top line
+    up = moves(edsel.rl, 5)   # each move scrolls down one line
+    print(f'lines sent for each move down {down} up {up}')
+    if max(down + up) > maxrows:
+        sys.exit(f'? a one-line move sent more than {maxrows} lines')
+
+if __name__ == '__main__':
+    main()
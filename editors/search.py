@@ -0,0 +1,180 @@
+"""
+search.py - Find lines in a sked buffer that match a search string or a
+            regular expression, without a Python loop over every line.
+
+Used by sked s(earch), r(everse), grep and c(hange).  The search string is
+compiled to a regular expression, which is cached so repeated searches
+do not compile it again.  A literal search string is escaped first, so it
+matches itself.  Then we join a segment of many lines into one string and
+let the compiled pattern search the whole segment at C speed.  When it finds
+a match, we map the match position back to a line by bisecting the table of
+line offsets in the segment.  The table is only built for segments with hits.
+A match that runs past the end of its line is not a hit, so a pattern finds
+the same lines it would find searching each line by itself.
+
+The functions at the end search files or copies of buffers and return the
+hits, or count and stage replacements in files.  They do not use the editor
+or the display, so they can run in worker processes, for tasking/agrep.py
+and tasking/areplace.py.
+
+See NOTES.txt for more notes.
+"""
+
+import os, re, bisect, shutil, itertools, functools
+
+seglines = 10000 # N of lines joined into each segment for searching
+
+@functools.lru_cache(maxsize=100)
+def pattern(target, regex=False):
+    """
+    Return compiled pattern for target string, from cache if we can.
+    If regex is False, target matches literally, like 'target in line'.
+    May raise re.error if regex is True and target is not a valid regex.
+    """
+    return re.compile(target if regex else re.escape(target), re.MULTILINE)
+
+def segment(buffer, start, stop):
+    """
+    Return list of lines start up to (not including) stop in buffer.
+    Buffers with an islice method (Rope) can then avoid keeping lines
+    from a mapped file loaded after we search them.
+    """
+    if hasattr(buffer, 'islice'):
+        return list(buffer.islice(start, stop))
+    return buffer[start:stop]
+
+def hits(pat, lines):
+    'Return list of indexes of lines in lines that compiled pattern pat matches'
+    text = ''.join(lines)
+    m = pat.search(text)
+    if not m:
+        return []
+    offsets = list(itertools.accumulate(map(len, lines), initial=0))
+    found = []
+    while m:
+        i = bisect.bisect_right(offsets, m.start()) - 1
+        if i >= len(lines): # empty match at the very end
+            break
+        # A match that crosses the end of its line, like a\s+b, is not a
+        # match in any one line, but some other match in the line might be.
+        if m.end() <= offsets[i+1] or pat.search(lines[i]):
+            found.append(i)
+        m = pat.search(text, offsets[i+1]) # next line, report each line once
+    return found
+
+def scan(buffer, pat, start, stop):
+    'Yield index of each line from start up to stop that pat matches, in order'
+    for first in range(start, stop, seglines):
+        lines = segment(buffer, first, min(first + seglines, stop))
+        for i in hits(pat, lines):
+            yield first + i
+
+def rscan(buffer, pat, start, stop):
+    'Yield index of each line from stop-1 down to start that pat matches'
+    for last in range(stop, start, -seglines):
+        first = max(last - seglines, start)
+        lines = segment(buffer, first, last)
+        for i in reversed(hits(pat, lines)):
+            yield first + i
+
+def find(buffer, pat, start, stop, forward=True):
+    """
+    Return index of first line from start up to stop that pat matches,
+    or last line if not forward.  Return None if no line matches.
+    """
+    found = scan(buffer, pat, start, stop) if forward else rscan(buffer, pat,
+                                                                   start, stop)
+    return next(found, None)
+
+def walk(top):
+    'Return sorted list of paths of files in directory tree top, skip .hidden'
+    fnames = []
+    for dirpath, dirnames, filenames in os.walk(top):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+        fnames += [ os.path.join(dirpath, f) for f in sorted(filenames)
+                    if not f.startswith('.') ]
+    return fnames
+
+def greplines(name, lines, target, regex=False):
+    """
+    Return list of (name, iline, line) for each line in lines that matches
+    target.  lines is a copy of a sked buffer, with dummy line at index 0.
+    """
+    pat = pattern(target, regex)
+    return [ (name, iline, lines[iline])
+             for iline in scan(lines, pat, 1, len(lines)) ]
+
+def grepfiles(fnames, target, regex=False):
+    """
+    Return list of (fname, iline, line) for each line in the files named in
+    fnames that matches target, like grep -n.  First line in file is 1.
+    Skip files that can't be read and files that look binary.
+    """
+    found = []
+    for fname in fnames:
+        try:
+            with open(fname, mode='r', errors='replace') as fd:
+                lines = ['\n'] + fd.readlines() # like sked buffer
+        except OSError:
+            continue
+        if len(lines) > 1 and '\0' in lines[1]: # binary file
+            continue
+        found += greplines(fname, lines, target, regex)
+    return found
+
+def substitute(lines, pat, new, regex=False, start=0):
+    """
+    Replace each match of pat in lines from start with new, like sked c(hange)
+    Return list of (iline, line) for each changed line, and N of replacements.
+    Do not change lines, the caller stores the changed lines.
+    """
+    repl = new if regex else (lambda match: new) # no backslash escapes in new
+    changed, count = [], 0
+    for iline in scan(lines, pat, start, len(lines)):
+        line, n = pat.subn(repl, lines[iline])
+        changed.append((iline, line))
+        count += n
+    return changed, count
+
+def readfile(fname):
+    """
+    Return list of lines in file fname with their line endings, so writing
+    them back changes nothing.  Undecodable bytes are kept as they are.
+    Return [] for a file that looks binary.
+    """
+    with open(fname, mode='r', newline='', errors='surrogateescape') as fd:
+        lines = fd.readlines()
+    return [] if lines and '\0' in lines[0] else lines
+
+def countfiles(fnames, target, new, regex=False):
+    'Return list of (fname, count) for files in fnames where target is replaced'
+    pat = pattern(target, regex)
+    counts = []
+    for fname in fnames:
+        try:
+            _, count = substitute(readfile(fname), pat, new, regex)
+        except OSError:
+            continue
+        if count: counts.append((fname, count))
+    return counts
+
+def stagefiles(fnames, target, new, regex=False, suffix='.replace~'):
+    """
+    Write the changed contents of each file in fnames to fname + suffix,
+    with the same permissions, but do not touch the file itself.
+    Return list of (fname, count), count 0 if nothing changed, nothing staged.
+    Raise OSError if any file can't be read or staged.
+    """
+    pat = pattern(target, regex)
+    staged = []
+    for fname in fnames:
+        lines = readfile(fname)
+        changed, count = substitute(lines, pat, new, regex)
+        if count:
+            for iline, line in changed: lines[iline] = line
+            with open(fname + suffix, mode='w', newline='',
+                      errors='surrogateescape') as fd:
+                fd.writelines(lines)
+            shutil.copymode(fname, fname + suffix)
+        staged.append((fname, count))
+    return staged
@@ -10,9 +10,58 @@ The name sked is inspired by Kragen Sitaker's Stone Knife Forth.
 """
 
 import os # for os.path.basename, used in store_buffer
-import textwrap
+import re, shutil, tempfile, textwrap, itertools, asyncio
+import concurrent.futures
+import rope # Rope buffer engine for very large buffers
+import mapped # load huge files lazily into Rope buffers
+import search # compiled pattern search for s, r, grep and c
+import trigram # optional trigram index of each buffer, for grepall
+import undo # undo and redo history of each buffer
+import journal # write-ahead journal of changes, to recover unsaved buffers
 ## import display # DEBUG, for display.putstr for debugging info
 
+class Buffer():
+    """
+    Items of one buffer: its name, file name, lines (also named buffer),
+    dot and so on.  The buffers dict maps each buffer name to its Buffer.
+    The items of the current buffer are also globals here, ed.dot etc.
+    save_buffer assigns them into the slots of the Buffer that is already
+    there and restore_buffer assigns them back, so switching buffers
+    makes no new objects.  Older code uses buffers like dicts, buf['dot']
+    and buf.get('dot', 0), so Buffer supports those too.
+    """
+    __slots__ = ('bufname', 'filename', 'buffer', 'dot', 'point', 'saved',
+                 'readonly', 'index', 'history', 'version', 'maxlines',
+                 'observers')
+
+    def __init__(self, bufname='no name', filename='no filename', buffer=None,
+                 dot=0, point=0, saved=True, readonly=False, index=None,
+                 history=None, version=0, maxlines=None, observers=None):
+        self.bufname = bufname
+        self.filename = filename
+        self.buffer = buffer if buffer is not None else ['\n']
+        self.dot = dot
+        self.point = point
+        self.saved = saved
+        self.readonly = readonly
+        self.index = index
+        self.history = history
+        self.version = version
+        self.maxlines = maxlines
+        self.observers = observers if observers is not None else []
+
+    def __getitem__(self, key):
+        if key not in self.__slots__: raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__: raise KeyError(key)
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.__slots__ else default
+
+
 # Define and initialize global variables used by sked editing functions,
 # but only the *first* time this module is imported in a session.
 # Then we can reload this module without re-initializing those variables,
@@ -29,19 +78,35 @@ except:
     bufname = filename  # Basename of filename, reassigned by e and w
     searchstring = 'def ' # reassigned by s(earch), r(everse) and c(hange) cmds
     replacestring = '??? ' # reassigned by c(hange) command
+    regex = False # True: searchstring is a regular expression, not literal
     pagesize = 12         # reassigned by v and mv page up/down commands
     saved = True          # True when no unsaved changes, safe to run e(dit).
+    readonly = False      # True in buffer opened by view, no editing.
+    index = None          # trigram.Index of buffer, or None if not indexed
+    autoindex = False     # True: e(dit) builds trigram index for each file
+    undolimit = 1000      # N of commands that can be undone in each buffer
+    history = undo.History(undolimit) # undo and redo lists for buffer
+    command = 0           # counts commands, to group their changes for undo
+    version = 0           # counts changes to buffer, so w knows if it changed
+    maxlines = None       # most lines kept in buffer, oldest dropped, see ring
+    observers = []        # functions called after each change, see observe
+    savesync = 'file'     # w calls fsync: 'none', 'file', or 'dir' also
+    saver = concurrent.futures.ThreadPoolExecutor(1) # w writes files in order
+    umask = os.umask(0); os.umask(umask) # for new files that w writes
     lmargin = 0           # left margin for wrap
     rmargin = 72          # right margin for wrap
     nindent = 4           # N of spaces to indent or outdent
+    ropelines = 100000    # buffers with more lines use Rope, not list
+    maplimit = 2**26      # files with more bytes are mapped, not read
     
     killed = [] #yank(paste) buffer filled by kill_region or repeated  kill_line
     
-    # saved buffers, dictionary from buffer names to dict of buffer items
+    # saved buffers, dictionary from buffer names to Buffer of buffer items
     # initialize so there is always a saved buffer to switch back to
     buffers = dict()
-    buffers[bufname] = {'bufname': bufname, 'filename': filename, 
-                        'buffer': buffer, 'dot': dot, 'saved': saved }
+    buffers[bufname] = Buffer(bufname, filename, buffer, dot, point, saved,
+                              readonly, index, history, version, maxlines,
+                              observers)
     
     prev_bufname = bufname # so we can switch back even before we save any  bfas
     
@@ -74,10 +139,114 @@ def range_valid(start, end):
     """
     return line_valid(start) and ((start == end) or line_valid(end)) 
 
-def status():
-    'status: return string of information about editing session'
-    return (f'{bufname}, at line {dot} of {S()}, file {filename}, ' 
-            f"{'saved' if saved else 'unsaved changes'}")
+def writable():
+    """
+    If current buffer can be edited return True,
+    otherwise print error message and return False.
+    """
+    if readonly:
+        print(f'? buffer {bufname} is read-only\n\r', end='')
+        return False
+    return True
+
+def compiled(target):
+    """
+    Return compiled search pattern for target string, regex or literal.
+    If target is not a valid regex, print error message and return None.
+    """
+    try:
+        return search.pattern(target, regex)
+    except re.error as err:
+        print(f"? '{target}' {err}\n\r", end='')
+        return None
+
+def status(buf=None, bdot=None):
+    """
+    status: return string of information about editing session.
+    buf is a saved Buffer from buffers, default is the current buffer.
+    bdot, if given, is shown instead of dot, as for a window.
+    """
+    if buf is None:
+        bname, nlines, fname, bsaved, breadonly = (bufname, S(), filename,
+                                                   saved, readonly)
+    else:
+        bname, nlines, fname, bsaved, breadonly = (buf.bufname,
+            len(buf.buffer)-1, buf.filename, buf.saved, buf.readonly)
+    if bdot is None: bdot = dot if buf is None else buf.dot
+    return (f'{bname}, at line {bdot} of {nlines}, file {fname}, ' 
+            + ('read-only' if breadonly else
+               'saved' if bsaved else 'unsaved changes'))
+
+# Change buffer contents
+
+# All changes to buffer contents go through splice, so any index
+# of the buffer can be updated to follow the changes, and they can be undone.
+
+def checkpoint():
+    'Begin a new command, so its changes are undone separately from others'
+    global command
+    command += 1
+
+def splice(start, stop, lines, buf=None, record=True, journaled=True):
+    """
+    Replace lines start up to (not including) stop in buffer with lines,
+    like buffer[start:stop] = lines.  Insert lines if start == stop.
+    buf is a saved Buffer from buffers, default is the current buffer.
+    If record, record the change in the history of the buffer, for undo.
+    If journaled, record it in the journal, for recover.  Output of tasks,
+    like writer appends, is not journaled, only the user's edits.
+    Then call each observer of the buffer, see observe.
+    """
+    global version
+    if buf is None:
+        version += 1
+        text, bindex, bhistory, fname, bobservers = (buffer, index, history,
+                                                     filename, observers)
+    else:
+        buf.version += 1
+        text, bindex, bhistory, fname, bobservers = (buf.buffer, buf.index,
+                                    buf.history, buf.filename, buf.observers)
+    lines = list(lines) # caller might change its list later, like killed
+    if journaled and journal.running:
+        journal.record('s', fname, start, stop, lines)
+    if record and bhistory and (lines or stop > start): # copy only changes
+        bhistory.record(command, start, text[start:stop], lines)
+    if bindex: bindex.update(text, start, stop, lines) # before the change
+    at = min(start, len(text)) # where lines go, like list slice assignment
+    nold = max(0, min(stop, len(text)) - at) # N of lines replaced
+    text[start:stop] = lines
+    for observer in bobservers:
+        observer(at, nold, lines)
+
+def trim(buf=None):
+    """
+    If buffer has more than maxlines lines, delete the oldest from the front.
+    Delete down to maxlines less one eighth, so each trim deletes many lines
+    at once and the cost of trimming is amortized O(1) for each line added.
+    buf is a saved Buffer from buffers, default is the current buffer.
+    The deleted lines can't be undone.  Move dot up with the lines.
+    Return N of lines deleted, so callers can move their own line numbers.
+    """
+    global dot
+    if buf is None:
+        text, nmax, bhistory = buffer, maxlines, history
+    else:
+        text, nmax, bhistory = buf.buffer, buf.maxlines, buf.history
+    if not nmax or len(text)-1 <= nmax:
+        return 0
+    ndelete = len(text)-1 - (nmax - nmax // 8)
+    splice(1, 1+ndelete, [], buf, record=False, journaled=False)
+    if bhistory: bhistory.drop(ndelete)
+    if buf is None:
+        dot = max(dot - ndelete, min(S(), 1))
+    else:
+        buf.dot = max(buf.dot - ndelete, min(len(text)-1, 1))
+    return ndelete
+
+def setline(iline, line):
+    'Replace line at iline in buffer with line, if it is different'
+    if line != buffer[iline]:
+        splice(iline, iline+1, [ line ])
 
 # Display code hooks
 
@@ -102,14 +271,15 @@ def set_saved(status):
 
 def restore_buffer(bname, printline=print):
     'Restore state of saved buffer bname to current saved buffer'
-    global bufname, filename, buffer, dot, point, saved
+    global bufname, filename, buffer, dot, point, saved, readonly, index
+    global history, version, maxlines, observers
     ## display.putstr(f'From {bufname} restore {bname}\n\r') # DEBUG
-    bufname = buffers[bname].get('bufname', 'no name')
-    filename = buffers[bname].get('filename', 'no filename')
-    buffer = buffers[bname].get('buffer', ['\n'])
-    dot = buffers[bname].get('dot', 0)
-    point = buffers[bname].get('point', 0)
-    saved = buffers[bname].get('saved', True)
+    buf = buffers[bname]
+    bufname, filename, buffer, dot, point = (buf.bufname, buf.filename,
+                                             buf.buffer, buf.dot, buf.point)
+    saved, readonly, index, history = (buf.saved, buf.readonly,
+                                       buf.index, buf.history)
+    version, maxlines, observers = buf.version, buf.maxlines, buf.observers
     printline(status()) # print the new buffer name
 
 def input_line():
@@ -119,11 +289,23 @@ def input_line():
 # File and buffer functions
 
 def save_buffer():
-    'Save state of current buffer including text, dot etc.'
-    global buffers
-    buffers[bufname] = {'bufname': bufname, 'filename': filename, 
-                        'buffer': buffer, 'dot': dot, 'point': point,
-                        'saved': saved }
+    'Save state of current buffer including text, dot etc. in its Buffer'
+    buf = buffers.get(bufname)
+    if buf is None:
+        buf = buffers[bufname] = Buffer()
+    buf.bufname, buf.filename, buf.buffer, buf.dot, buf.point = (bufname,
+                                         filename, buffer, dot, point)
+    buf.saved, buf.readonly, buf.index, buf.history = (saved, readonly,
+                                                       index, history)
+    buf.version, buf.maxlines, buf.observers = version, maxlines, observers
+
+def newbuffer(lines):
+    """
+    Return buffer for lines: the list itself, or a Rope for very long lists.
+    Rope edits are O(log n) but indexing is slower, see ropebench.py.
+    Reassign ropelines to change the size where we switch to Rope.
+    """
+    return rope.Rope(lines) if len(lines) > ropelines else lines
 
 def bname(filename):
     'Generate buffer name from file name, ensure each file gets unique bname'
@@ -137,53 +319,181 @@ def bname(filename):
         bufname = basename + f'<{suffix}>' # alter candidate bufname
     return bufname
 
-def e(fname, move_dot=move_dot):  # move_dot is a hook for display code 
+def loaded(fname):
     """
-    e(dit), load named file into buffer, replacing previous contents.
-    But first save buffer state so it can be restored on command.
+    If file fname is already in the current buffer or a saved buffer,
+    print error message and return True, otherwise return False.
     """
-    global filename, buffer, saved, bufname, prev_bufname
     if fname == filename:
         print(f'? file {fname} is already in the current buffer\r\n', end='')
-        return
+        return True
     for buffername in buffers: # can't use bufname here - shadows sked.bufname
-        bfname = buffers[buffername].get('filename','no filename')
+        bfname = buffers[buffername].filename
         if fname == bfname:
             print(f'? file {fname} is already in the saved buffer {buffername}\r\n', end='')
-            return
+            return True
+    return False
+
+def e(fname, move_dot=move_dot):  # move_dot is a hook for display code 
+    """
+    e(dit), load named file into buffer, replacing previous contents.
+    But first save buffer state so it can be restored on command.
+    """
+    global filename, buffer, saved, bufname, prev_bufname, readonly, index
+    global history, version, maxlines, observers
+    if loaded(fname):
+        return
+    if journal.running and os.path.abspath(fname) in journal.unrecovered:
+        # loading would record 'e', which discards the changes in journal
+        print(f'? {fname} has unsaved changes in journal, recover() them, '
+              f'or journal.discard({fname!r})\n\r', end='')
+        return
     if S() > 0: save_buffer()
     try:
-        with open(fname, mode='r') as fd:
-            # fd.readlines reads file into a list of strings, one per line
-            # First line of file is at index 1 not 0
-            buffer = ['\n'] + fd.readlines() # each line in buffer ends with \n
+        if os.path.getsize(fname) > maplimit: # huge, don't read it all now
+            buffer = mapped.load(fname) # Rope that decodes lines when needed
+        else:
+            with open(fname, mode='r', errors='surrogateescape') as fd:
+                # fd.readlines reads file into a list of strings, one per line
+                # First line of file is at index 1 not 0
+                buffer = ['\n'] + fd.readlines() # each line ends with \n
+                buffer = newbuffer(buffer) # Rope if it is very long
     except FileNotFoundError:
         buffer = ['\n'] # start new file
     prev_bufname = bufname
     filename = fname
     bufname = bname(filename) # creates new buffer if e() on same file
     saved = True # put this *before* move_dot for display code
+    readonly = False
+    index = trigram.Index(buffer) if autoindex else None
+    history = undo.History(undolimit)
+    version = 0
+    maxlines = None
+    observers = []
+    if journal.running: journal.record('e', filename) # changes start here
     move_dot(min(S(),1)) # start of buffer, empty buffer S() is 0
     save_buffer() # the new current buffer is also in the saved buffers
-    print(f'{filename}, {S()} lines\n\r', end='')
+    counting = ', counting more' if mapped.counting(buffer) else ''
+    print(f'{filename}, {S()} lines{counting}\n\r', end='')
+
+def view(fname, move_dot=move_dot):  # move_dot is a hook for display code 
+    """
+    view file read-only, for huge files like logs.  Like e(dit) but the file
+    is mapped, not read, and only the lines you page or search are decoded.
+    Paging, printing and searching work, editing commands do not.
+    """
+    global filename, buffer, saved, bufname, prev_bufname, readonly, index
+    global history, version, maxlines, observers
+    if loaded(fname):
+        return
+    try:
+        vbuffer = mapped.View(fname)
+    except OSError as err: # FileNotFoundError, PermissionError, ...
+        print(f'? {err}\r\n', end='')
+        return
+    if S() > 0: save_buffer()
+    buffer = vbuffer
+    prev_bufname = bufname
+    filename = fname
+    bufname = bname(filename)
+    saved = True
+    readonly = True
+    index = None # read-only buffer might be huge, grepall skips it
+    history = None # can't change, nothing to undo
+    version = 0
+    maxlines = None
+    observers = []
+    move_dot(min(S(),1))
+    save_buffer()
+    print(f'{filename}, {S()} lines, read-only\n\r', end='')
+
+def writefile(fname, lines):
+    """
+    Write lines, a sked buffer, to file fname.  Write a new file, then rename
+    it to fname, so fname is never half written and a mapped buffer can still
+    read its old file.  Call fsync as savesync says.  Might raise OSError.
+    The new file has a unique name in the same directory, so it does not
+    overwrite fname~, an emacs backup, and is removed if the write fails.
+    """
+    dirname = os.path.dirname(os.path.abspath(fname))
+    tfd, tname = tempfile.mkstemp(dir=dirname, prefix='.sked-')
+    try:
+        with open(tfd, 'w', errors='surrogateescape') as fd: # mapped.decode
+            # islice not buffer[1:], don't copy or load whole buffer
+            fd.writelines(itertools.islice(lines, 1, None)) # file starts at 1
+            if savesync != 'none':
+                fd.flush()
+                os.fsync(fd.fileno()) # new contents are on disk before rename
+        if os.path.exists(fname): shutil.copymode(fname, tname)
+        else: os.chmod(tname, 0o666 & ~umask) # mkstemp makes it 0o600
+        os.replace(tname, fname)
+    except BaseException:
+        try:
+            os.remove(tname)
+        except OSError:
+            pass
+        raise
+    if savesync == 'dir': # rename is on disk too
+        dirfd = os.open(dirname, os.O_RDONLY)
+        os.fsync(dirfd)
+        os.close(dirfd)
 
 def w(fname=None, set_saved=set_saved): # Hook for display code
     """
     w(rite) buffer to file, default fname is in filename.
     If fname is given, assign it to filename to be used for future writes.
+    In a running event loop, write a copy of the buffer in a thread, so
+    editing continues.  When it finishes, set_saved if buffer is unchanged.
+    Then return future that is done when the write finishes, else None.
     """
-    global filename, bufname, saved
+    global filename, bufname
+    if not writable():
+        return
     if not fname: fname = filename
-    success = False # Might fail if path doesn't exist, no permission etc.
-    with open(fname, 'w') as fd:
-        fd.writelines(buffer[1:]) # first line of file is at index 1 not 0
-        success = True
-    if success:
-        if filename != fname: # we saved buffer with a new, different filename
-            filename = fname
-            bufname = bname(filename)
-        set_saved(True)
-        print(f'Wrote {filename}, {S()} lines\n\r', end='') # \n\r char mode
+    oldname, oldbufname = filename, bufname
+    if filename != fname: # we save buffer with a new, different filename
+        filename = fname
+        bufname = bname(filename)
+    text, v = buffer, version # to check buffer when write finishes
+    snapshot = buffer # what the write writes, all counted when it finishes
+    mark = journal.mark(fname) if journal.running else None
+
+    def finish(error): # called in event loop thread when write finishes
+        global filename, bufname
+        if error:
+            print(f'? {error}\n\r', end='')
+            if buffer is text and filename == fname != oldname:
+                filename, bufname = oldname, oldbufname
+            return
+        unchanged = (version == v) if buffer is text else any(
+            buf.buffer is text and buf.version == v
+            for buf in buffers.values())
+        if journal.running:
+            journal.record('w', fname, mark, unchanged)
+            if oldname != fname: journal.record('k', oldname)
+        if buffer is text and unchanged:
+            set_saved(True)
+        for buf in buffers.values(): # maybe not current buffer now
+            if buf.buffer is text and unchanged: buf.saved = True
+        nlines = len(snapshot) - 1
+        print(f'Wrote {fname}, {nlines} lines\n\r', end='') # \n\r char mode
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError: # no event loop to block, just write
+        try:
+            writefile(fname, buffer)
+        except OSError as error:
+            finish(error)
+        else:
+            finish(None)
+        return
+    # Copy the buffer now, so later edits don't change what the thread writes
+    snapshot = buffer.snapshot() if isinstance(buffer, rope.Rope) else buffer[:]
+    future = loop.run_in_executor(saver, writefile, fname, snapshot)
+    future.add_done_callback(lambda future: finish(
+        'write cancelled' if future.cancelled() else future.exception()))
+    return future
 
 def b(bname=None, restore_buffer=restore_buffer):
     """
@@ -206,14 +516,13 @@ def bstatus(bname):
     'Return string of information about named stored buffer'
     if bname in buffers:
         buf = buffers[bname]
-        buffername = buf.get('bufname','no name')
-        fname = buf.get('filename','no filename')
-        blines = buf.get('buffer',['\n'])
-        bsaved = buf.get('saved', True)
+        buffername, fname, blines = buf.bufname, buf.filename, buf.buffer
+        bsaved, breadonly = buf.saved, buf.readonly
         # Use old fashinoned % formatting to get left-justified columns
         status = ('%s%-15s %7d   %-30s  %s' % 
                   ('*' if bufname == buffername else ' ', 
                    buffername, len(blines)-1, fname, 
+                   'read-only' if breadonly else
                    'saved' if bsaved else 'unsaved changes'))
     else:
         status = f'{bname} not in stored buffers'
@@ -223,6 +532,45 @@ def n():
     'n(ames), print names and other information about stored buffers'
     for bname in buffers: print(bstatus(bname)+'\n\r', end='') # for char mode
 
+def ring(nlines=None, bname=None):
+    """
+    Make buffer bname, default current buffer, keep only its last nlines
+    lines, like a ring buffer for logs.  Older lines are deleted as new lines
+    are added by writer, see trim.  nlines None: keep all lines, the default.
+    """
+    global maxlines
+    if not bname: bname = bufname
+    if bname == bufname:
+        maxlines = nlines
+        trim()
+    elif bname in buffers:
+        buffers[bname].maxlines = nlines
+        trim(buffers[bname])
+    else:
+        print(f'? no buffer {bname}\n\r', end='')
+
+def observe(observer, bname=None):
+    """
+    Call observer(start, nold, lines) after each change to buffer bname,
+    default current buffer: nold lines at index start were replaced by lines.
+    So an incremental feature can recompute only the lines that changed.
+    """
+    if not bname: bname = bufname
+    if bname == bufname:
+        observers.append(observer)
+    elif bname in buffers:
+        buffers[bname].observers.append(observer)
+    else:
+        print(f'? no buffer {bname}\n\r', end='')
+
+def unobserve(observer, bname=None):
+    'Stop calling observer after changes to buffer bname, default current'
+    if not bname: bname = bufname
+    bobservers = observers if bname == bufname else (
+        buffers[bname].observers if bname in buffers else [])
+    if observer in bobservers:
+        bobservers.remove(observer)
+
 def k(restore_buffer=restore_buffer):
     """
     k(ill) the current buffer and delete it from stored buffers.
@@ -237,9 +585,36 @@ def k(restore_buffer=restore_buffer):
             return
     if bufname in buffers: # current buffer might not be saved yet
         del buffers[bufname]
+    if journal.running: journal.record('k', filename) # discard its changes
     # prev buffer may have been killed, but there is always a saved scratch.txt
     restore_buffer(prev_bufname if prev_bufname in buffers else 'scratch.txt')
 
+def recover(move_dot=move_dot): # move_dot is a hook for display code
+    """
+    recover buffers that had unsaved changes when the editor stopped,
+    from the journal: load the saved file, then replay the changes.
+    Files already in a buffer are not recovered.  u(ndo) undoes recovery.
+    """
+    global saved
+    if journal.running: journal.flush() # so the journal file is complete
+    changes = journal.unsaved()
+    if not changes:
+        print('? no unsaved changes in journal\n\r', end='')
+    for fname, fchanges in changes.items():
+        fnames = [ buf.filename for buf in buffers.values() ]
+        if fname in map(os.path.abspath, fnames + [ filename ]):
+            print(f'? file {fname} is already in a buffer\n\r', end='')
+            continue
+        journal.unrecovered.discard(fname) # so e loads it
+        e(fname) # no display yet, replay first
+        checkpoint()
+        for start, stop, lines in fchanges:
+            splice(start, stop, lines)
+        saved = False # put this *before* move_dot for display code
+        move_dot(min(dot, S()))
+        save_buffer()
+        print(f'{fname}, recovered {len(fchanges)} changes\n\r', end='')
+
 # File viewer functions
 
 def p(start=None, end=None, printline=print, move_dot=move_dot): # with hooks 
@@ -293,6 +668,7 @@ def rv(nlines=None, p=p, move_dot=move_dot):  # with hooks for display code
 def s(target=None, forward=True, printline=print, move_dot=move_dot):  # hooks 
     """
     s(earch) forward  for next line containing target string.
+    If regex is True, target is a regular expression.
     Default searches forward, set forward=False to search backward.
     If target found, print line and assign to dot.
     If target not found, leave dot unchanged and print '? <target> not found'
@@ -300,36 +676,80 @@ def s(target=None, forward=True, printline=print, move_dot=move_dot):  # hooks
     If target is omitted, use stored searchstring.  
     """
     global searchstring
-    found = False
     if not target: target = searchstring
     searchstring = target
-    for iline in range(dot+1,S()+1) if forward else range(dot-1,0,-1):
-        if target in buffer[iline]:
-            found = True
-            printline(buffer[iline], end='') # line already ends with \n
-            move_dot(iline)
-            break
-    if not found:
+    pattern = compiled(target)
+    if not pattern:
+        return
+    iline = (search.find(buffer, pattern, dot+1, S()+1) if forward
+             else search.find(buffer, pattern, 1, dot, forward=False))
+    if iline:
+        printline(buffer[iline], end='') # line already ends with \n
+        move_dot(iline)
+    else:
         print(f"? '{searchstring}' not found\n\r", end="") # for char mode
 
 def grep(target=None, start=None, end=None):
     """
     Print each line in range start, end that contains target string.
+    If regex is True, target is a regular expression.
     Default range is entire buffer.  Current line, dot, is *not* changed.
     """
     global searchstring
     found = False
     if not target: target = searchstring
     searchstring = target
+    pattern = compiled(target)
+    if not pattern:
+        return
     if not start: start = 1
     if not end: end = S()
-    for iline in range(start, end+1):
-        if target in buffer[iline]:
-            found = True
-            print('%3d %s' % (iline, buffer[iline]), end='') 
+    for iline in search.scan(buffer, pattern, start, end+1):
+        found = True
+        print('%3d %s' % (iline, buffer[iline]), end='') 
     if not found:
         print(f"? '{searchstring}' not found")
 
+def grepall(target=None):
+    """
+    Print each line in every stored buffer that contains target string,
+    with buffer name and line number.  Use trigram index where there is one.
+    Read-only buffers opened by view are not searched, they might be huge.
+    """
+    global searchstring
+    found = False
+    if not target: target = searchstring
+    searchstring = target
+    pattern = compiled(target)
+    if not pattern:
+        return
+    for bname, buf in buffers.items():
+        if bname == bufname: # current buffer might differ from saved
+            text, bindex, bro = buffer, index, readonly
+        else:
+            text, bindex, bro = buf.buffer, buf.index, buf.readonly
+        if bro:
+            continue
+        # Can't get trigrams from a regex, so search all of its buffer
+        ranges = (bindex.candidates(target) if bindex and not regex
+                  else [ (1, len(text)) ])
+        for start, stop in ranges:
+            for iline in search.scan(text, pattern, max(start, 1), stop):
+                found = True
+                print('%-15s %5d %s' % (bname, iline, text[iline]), end='')
+    if not found:
+        print(f"? '{searchstring}' not found")
+
+def ix(on=True):
+    """
+    i(nde)x, build trigram index of current buffer so grepall is faster.
+    The index follows all edits.  ix(False) discards the index.
+    Assign autoindex = True to index every file loaded by e(dit).
+    """
+    global index
+    index = trigram.Index(buffer) if on and not readonly else None
+    save_buffer()
+
 def r(target=None):
     'r(everse) search backward for next line containing target string'
     s(target, forward=False)
@@ -357,6 +777,9 @@ def a(iline=None, move_dot=move_dot, input_line=input_line,
     move_dot, input_line, and move_dot_a are placeholders for display fcns.
     """
     global buffer, saved
+    if not writable():
+        return
+    checkpoint() # so undo undoes all changes made by this command
     if iline is None: iline = dot
     # Can't use line_valid - must allow append after line 0 to append at line 1.
     if not (0 <= iline <= S()):
@@ -370,7 +793,7 @@ def a(iline=None, move_dot=move_dot, input_line=input_line,
         if success:
             if line == '.':
                 return
-            buffer[dot+1:dot+1] = [line + '\n'] # sic, append line after dot
+            splice(dot+1, dot+1, [line + '\n']) # sic, append line after dot
             saved = False # put this before move_dot for display
             move_dot_a(dot+1)
 
@@ -384,6 +807,9 @@ def d(start=None, end=None, append=None, move_dot=move_dot):
     If append=True, append to killed so consecutive d's accumulate there.
     """
     global buffer, killed, saved
+    if not writable():
+        return
+    checkpoint()
     if not start: start = dot
     if not end: end = start
     if not range_valid(start, end):
@@ -392,7 +818,7 @@ def d(start=None, end=None, append=None, move_dot=move_dot):
         killed = buffer[start:end+1] # range includes end, unlike Python slices
     else:
         killed += buffer[start:end+1] # append to accumulated consecutive d's
-    buffer[start:end+1] = [] 
+    splice(start, end+1, [])
     saved = False # put this before move_dot for display
     # We might have deleted the last line in the buffer.
     new_dot = start if start < len(buffer) else len(buffer)-1
@@ -401,11 +827,14 @@ def d(start=None, end=None, append=None, move_dot=move_dot):
 def y(iline=None, move_dot=move_dot): # move_dot is hook for display code
     'y(ank), that is paste, killed contents *before* iline (default dot)'
     global buffer, saved
+    if not writable():
+        return
+    checkpoint()
     if not iline: iline = dot
     if iline == 0: iline = 1 # buffer[0] is always inaccessible dummy \n
     if S() > 0 and not line_valid(iline): # S() == 0 when yank to empty buffer
         return
-    buffer[iline:iline] = killed # insert killed contents *before* iline
+    splice(iline, iline, killed) # insert killed contents *before* iline
     saved = False # put this before move_dot for display
     move_dot(iline + len(killed)) # same text line, now first after yanked
 
@@ -420,10 +849,14 @@ def c(old=None, new=None, start=None, end=None, count=-1, printline=print,
     If new is None, use stored replacestring.
      Can use '' in new to delete old, but can't use '' as placeholder.
     If new is not None, assign new to replacestring.
+    If regex is True, old is a regular expression and new may use \\1 etc.
     Default count=-1 replaces all occurences on each line.
     Assign count to n to replace first n occurrences on each line.
     """
     global searchstring, replacestring, saved
+    if not writable():
+        return
+    checkpoint()
     if not start: start = dot
     if not end: end = start
     if not range_valid(start, end):
@@ -432,12 +865,19 @@ def c(old=None, new=None, start=None, end=None, count=-1, printline=print,
     searchstring = old
     if new is None: new = replacestring
     if new is not None: replacestring = new
-    for iline in range(start, end+1): # range is not inclusive so +1
-        if old in buffer[iline]:
-            buffer[iline] = buffer[iline].replace(old, new, count)
-            saved = False # put this *before* move_dot for display code
-            move_dot(iline) # puts cursor on the command line for print below
-            printline(buffer[iline], end='') # don't print when display enabled
+    if count == 0: # like str.replace, replace no occurrences
+        return
+    pattern = compiled(old)
+    if not pattern:
+        return
+    # Literal new must not be parsed for regex escapes like \1, so use fcn
+    repl = new if regex else (lambda match: new)
+    nsub = max(count, 0) # re.sub replaces all when its count is 0
+    for iline in search.scan(buffer, pattern, start, end+1): # not inclusive
+        setline(iline, pattern.sub(repl, buffer[iline], nsub))
+        saved = False # put this *before* move_dot for display code
+        move_dot(iline) # puts cursor on the command line for print below
+        printline(buffer[iline], end='') # don't print when display enabled
 
 # Formatting functions
 
@@ -450,6 +890,9 @@ def indent(start=None, end=None, nspaces=None, outdent=False,
     If outdent, move text to left by removing characters from left margin.
     """
     global nindent
+    if not writable():
+        return
+    checkpoint()
     if not start: start = dot
     if not end: end = start
     if not range_valid(start, end):
@@ -457,11 +900,12 @@ def indent(start=None, end=None, nspaces=None, outdent=False,
     if not nspaces: nspaces = nindent
     nindent = nspaces # int
     margin = ' '*nspaces # str
-    for iline in range(start, end+1): # start, end inclusive
-        if outdent:
-            buffer[iline] = buffer[iline][nspaces:]
-        else: # indent
-            buffer[iline] = margin + buffer[iline]
+    lines = buffer[start:end+1] # start, end inclusive
+    if outdent:
+        lines = [ line[nspaces:] for line in lines ]
+    else: # indent
+        lines = [ margin + line for line in lines ]
+    splice(start, end+1, lines)
     change_lines(start, end) # move dot to end
 
 def outdent(start=None, end=None, nspaces=None, change_lines=change_lines):
@@ -477,6 +921,9 @@ def wrap(start=None, end=None, lmarg=None, rmarg=None,
     if lmarg (or rmarg) is given, lmargin (or rmargin) is set to that value.
     """
     global lmargin, rmargin, killed
+    if not writable():
+        return
+    checkpoint()
     if not start: start = dot
     if not end: end = dot
     if not range_valid(start, end):
@@ -491,8 +938,7 @@ def wrap(start=None, end=None, lmarg=None, rmarg=None,
     wlines = textwrap.wrap(slines, width=rmargin, initial_indent=margin,
                            subsequent_indent=margin) # returns list of lines
     wrapped = [ line + '\n' for line in wlines ]
-    buffer[start:end+1] = []  # delete unwrapped lines
-    buffer[start:start] = wrapped # sic, insert lines at this position
+    splice(start, end+1, wrapped) # replace unwrapped lines
     killed = wrapped # FIXME? hack so we can use edsel display_y for move_dot
     move_dot(start + len(wrapped) - 1) # move dot to end of wrapped text
 
@@ -501,12 +947,54 @@ def j(start=None, end=None, move_dot=move_dot):
     j(oin) successive lines into one line. Replace line breaks with spaces.
     start defaults to dot, end defaults to dot+1 to join next line to dot.
     """
+    if not writable():
+        return
+    checkpoint()
     if not start: start = dot
     if not end: end = dot+1
     if not range_valid(start, end):
         return
     lines = [ line.rstrip('\n') for line in buffer[start:end+1] ]
     joined = ' '.join(lines)+'\n' # put spaces between joined lines
-    buffer[start:end+1] = [] # delete unjoined lines
-    buffer[start:start] = [ joined ] # insert [ joined ] lines at start
+    splice(start, end+1, [ joined ]) # replace unjoined lines
     move_dot(start) # move dot to joined line
+
+# Undo functions
+
+def replay(group, backward, move_dot):
+    """
+    Undo each change in group, in reverse order, if backward is True,
+    otherwise redo them in order.  Don't record these changes in history.
+    Then move dot to the first changed line.
+    """
+    global saved
+    for start, old, new in (reversed(group) if backward else group):
+        lines, replaced = (old, new) if backward else (new, old)
+        splice(start, start + len(replaced), lines, record=False)
+    saved = False # put this *before* move_dot for display code
+    first = min(start for start, _, _ in group)
+    move_dot(max(min(first, S()), min(1, S()))) # 0 only if buffer is empty
+
+def u(move_dot=move_dot): # move_dot is hook for display code
+    """
+    u(ndo) the most recent command that changed the buffer.
+    Repeat to undo earlier commands, up to undolimit commands.
+    redo undoes u.
+    """
+    if not writable():
+        return
+    group = history.undo() if history else None
+    if not group:
+        print('? nothing to undo\n\r', end='')
+        return
+    replay(group, True, move_dot)
+
+def redo(move_dot=move_dot): # move_dot is hook for display code
+    'redo the most recent command that u undid'
+    if not writable():
+        return
+    group = history.redo() if history else None
+    if not group:
+        print('? nothing to redo\n\r', end='')
+        return
+    replay(group, False, move_dot)
@@ -0,0 +1,114 @@
+"""
+trigram.py - Trigram index of a sked buffer, so grepall can find the few
+             places where a string might occur without reading every line.
+
+The index divides the buffer into blocks of consecutive lines and records,
+for each trigram (each substring of three characters), the set of blocks
+that contain it.  Every line that contains a search string of three or more
+characters must be in a block that contains all the trigrams of the string,
+so we intersect those sets to get a short list of candidate blocks, then
+search only those.
+
+Blocks have ids that do not change when lines are inserted or deleted
+elsewhere in the buffer, so an edit only reindexes the blocks it touches.
+sked.splice calls update before every change to an indexed buffer.
+
+See NOTES.txt for more notes.
+"""
+
+import bisect, itertools, collections
+
+blocklines = 32 # N of lines in each block when blocks are (re)built
+
+def trigrams(lines):
+    'Return set of all trigrams in list of lines, joined'
+    text = ''.join(lines)
+    return { text[i:i+3] for i in range(len(text)-2) }
+
+class Index():
+    """
+    Trigram index of buffer.  Usage: index = Index(buffer) then call
+    index.update(buffer, start, stop, lines) before every change
+    buffer[start:stop] = lines, and index.candidates(target) to search.
+    """
+    def __init__(self, buffer):
+        self.grams = collections.defaultdict(set) # trigram -> block ids
+        self.blocks = [] # [id, nlines] for each block, in buffer order
+        self.ids = itertools.count() # block ids, never reused
+        self.starts = None # index of first line in each block, None until located
+        lines = iter(buffer) # don't slice, Rope might have mapped lines
+        while True:
+            block = list(itertools.islice(lines, blocklines))
+            if not block:
+                break
+            self.add(len(self.blocks), block)
+        if not self.blocks: self.blocks = [ [next(self.ids), 0] ]
+
+    def add(self, k, lines):
+        'Insert new block of lines at position k in blocks, index its trigrams'
+        bid = next(self.ids)
+        self.blocks.insert(k, [bid, len(lines)])
+        for gram in trigrams(lines):
+            self.grams[gram].add(bid)
+
+    def remove(self, k, lines):
+        'Remove block at position k in blocks, lines are its lines'
+        bid, _ = self.blocks.pop(k)
+        for gram in trigrams(lines):
+            bids = self.grams[gram]
+            bids.discard(bid)
+            if not bids: del self.grams[gram]
+
+    def locate(self):
+        'Return starts, index of the first line in each block, and one past last'
+        if self.starts is None:
+            self.starts = list(itertools.accumulate(
+                (n for _, n in self.blocks), initial=0))
+        return self.starts
+
+    def update(self, buffer, start, stop, lines):
+        """
+        Update index for buffer[start:stop] = lines, call *before* the change.
+        Reindex the blocks that hold lines start up to stop, together with
+        neighbors that are (or would become) less than half full, so blocks
+        merge as well as split.  Shift starts of the following blocks.
+        """
+        starts = self.locate()
+        nblocks = len(self.blocks) # start might be at the end, after last block
+        first = min(bisect.bisect_right(starts, start) - 1, nblocks - 1)
+        last = min(bisect.bisect_right(starts, max(stop-1, start)) - 1, nblocks-1)
+        half = blocklines // 2
+        nnew = starts[last+1] - starts[first] + len(lines) - (stop - start)
+        while first > 0 and (nnew < half or self.blocks[first-1][1] < half):
+            first -= 1
+            nnew += self.blocks[first][1]
+        while last < nblocks-1 and (nnew < half or self.blocks[last+1][1] < half):
+            last += 1
+            nnew += self.blocks[last][1]
+        bstart, bstop = starts[first], starts[last+1]
+        old = buffer[bstart:bstop]
+        new = old[:start-bstart] + list(lines) + old[stop-bstart:]
+        for k in range(last, first-1, -1):
+            klines = old[starts[k]-bstart:starts[k+1]-bstart]
+            self.remove(k, klines)
+        nsplit = max(1, -(-len(new) // blocklines)) # even sizes, none too small
+        bounds = [ i*len(new)//nsplit for i in range(nsplit+1) ]
+        for k in range(nsplit):
+            self.add(first + k, new[bounds[k]:bounds[k+1]])
+        delta = len(new) - (bstop - bstart)
+        starts[first:] = ([ bstart + b for b in bounds ] +
+                          [ s + delta for s in starts[last+2:] ])
+
+    def candidates(self, target):
+        """
+        Return list of (start, stop) ranges of lines that might contain target.
+        A target shorter than three characters can be anywhere.
+        """
+        starts = self.locate()
+        if len(target) < 3:
+            return [ (starts[0], starts[-1]) ]
+        grams = sorted((self.grams.get(gram, set())
+                        for gram in trigrams([target])), key=len)
+        bids = set.intersection(*grams)
+        return [ (starts[k], starts[k+1]) for k, (bid, _) in
+                 enumerate(self.blocks) if bid in bids ] if bids else []
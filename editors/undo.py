@@ -0,0 +1,82 @@
+"""
+undo.py - History, the undo and redo lists for one sked buffer.
+
+A History does not keep copies of the buffer.  sked.splice records a delta
+for each change: the index of the first line changed, the old lines that
+were replaced, and the new lines that replaced them.  So memory grows with
+the size of the edits, not the size of the buffer, and undoing a change
+only splices back the lines it touched.
+
+The deltas made by one command, such as sked.c that changes many lines or
+typing a run of characters in pmacs, form one group, which undo and redo
+handle together.  sked.checkpoint starts a new group.
+
+See NOTES.txt for more notes.
+"""
+
+class History():
+    """
+    Undo and redo lists of groups of deltas for one buffer.
+    Each delta is a tuple (start, old, new): buffer[start:start+len(old)]
+    was old lines, now buffer[start:start+len(new)] is new lines.
+    """
+    def __init__(self, limit=1000):
+        self.limit = limit # N of groups kept for undo, drop oldest
+        self.done = []     # groups that can be undone, most recent last
+        self.undone = []   # groups that can be redone, most recent last
+        self.command = None # command that made most recent group, see record
+
+    def record(self, command, start, old, new):
+        """
+        Record delta for buffer[start:start+len(old)] = new, made by command.
+        command counts the commands, so a new command starts a new group.
+        Any new change discards the groups that could be redone.
+        """
+        if command != self.command or not self.done:
+            self.done.append([])
+            self.command = command
+            if len(self.done) > self.limit:
+                del self.done[0]
+        group = self.done[-1]
+        if group and group[-1][0] == start and len(group[-1][2]) == len(old):
+            # Change replaces the lines just changed, like typing in pmacs.
+            # Merge into one delta, so undo info does not grow with each key.
+            group[-1] = (start, group[-1][1], new)
+        else:
+            group.append((start, old, new))
+        self.undone.clear()
+
+    def drop(self, nlines):
+        """
+        Lines 1 through nlines were deleted from the front of the buffer,
+        not recorded, like sked.trim.  Move later deltas up nlines.  Forget
+        groups that changed those lines, and all groups before them, which
+        can't be undone now.  Forget the groups that could be redone.
+        """
+        self.undone.clear()
+        for i in range(len(self.done)-1, -1, -1):
+            group = self.done[i]
+            if any(start <= nlines for start, old, new in group):
+                del self.done[:i+1]
+                self.command = None # don't add to a group that was forgotten
+                break
+            self.done[i] = [ (start - nlines, old, new)
+                             for start, old, new in group ]
+
+    def undo(self):
+        'Return most recent group from done, move it to undone, or None'
+        if not self.done:
+            return None
+        group = self.done.pop()
+        self.undone.append(group)
+        self.command = None # next change starts a new group
+        return group
+
+    def redo(self):
+        'Return most recent group from undone, move it back to done, or None'
+        if not self.undone:
+            return None
+        group = self.undone.pop()
+        self.done.append(group)
+        self.command = None
+        return group
@@ -22,7 +22,8 @@ def apmrun():
     Call pymacs runcmd, check for exit
     """
     c = terminal.getchar() # not blocking, asyncio calls apmrun when char is ready
-    pmacs.runcmd(c) # assigns running = False to exit
+    with display.frame(): # one write for the whole command
+        pmacs.runcmd(c) # assigns running = False to exit
     if not pmacs.running:
         pyshell.cmd_mode = True
         pmacs.restore() # calls restore_cursor_to_cmdline
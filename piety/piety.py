@@ -7,6 +7,8 @@ piety.py - Starts a Piety session.  Creates an event loop named
 
 import sys, asyncio
 import pyshell, apyshell, apmacs
+import journal # so unsaved buffers can be recovered if the session is lost
+import writer # so threads that write to buffers hand their lines to piety
 
 # So we can run scripts that name piety from the apysh >>>> prompt
 # Identifiers assigned in the script remain in the session.
@@ -23,10 +25,13 @@ def handler():
     else:
         fgjob()  
 
+journal.start() # prints files that recover() can recover from last session
+
 apyshell.running = True
 apyshell.setup() # print >>>> prompt, etc.
 
 piety = asyncio.get_event_loop()
+writer.loop = piety # before any thread writes, see writer.post
 piety.add_reader(sys.stdin, handler)
 piety.run_forever()
 
@@ -0,0 +1,193 @@
+"""
+agrep.py - Search many files or all the editor buffers for a string in
+           worker processes, while the shell and editor keep running.
+           Hits appear in a results buffer as they are found.
+
+Usage, at the pysh prompt in a Piety session:
+
+  agrep('def splice', '.')    # search files in directory tree, here .
+  agrep('def splice')         # search all sked buffers
+  cancel()                    # stop the search that is running
+  hit()                       # go to the hit at the dot in results buffer
+  nexthit()  prevhit()        # go to the next or previous hit
+
+See README.md for more notes.
+"""
+
+import re, asyncio, concurrent.futures
+import sked as ed
+import edsel as fr  # short for 'frame'
+import search
+import rope, mapped # for buffers of huge files, see snapshots
+import undo # for clear
+from writer import Writer
+
+# Define and initialize global variables used by this module,
+# but only the *first* time this module is imported.
+try:
+    _ = results # if this variable is defined, then module was already imported
+except:
+    results = 'grep.txt' # name of results buffer
+    workers = None   # N of worker processes, None means N of processors
+    batchsize = 16   # N of files searched in each job sent to a worker
+    task = None      # asyncio task for the search that is running, if any
+    nhits = 0        # N of hits found so far by most recent search
+
+hitline = re.compile(r'^(.*?):(\d+): ') # name:iline: line, as written below
+
+def clear(bname):
+    'Empty the buffer named bname, create it if it does not exist'
+    if bname not in ed.buffers:
+        ed.buffers[bname] = ed.Buffer(bname, bname)
+    buf = ed.buffers[bname]
+    current = (bname == ed.bufname)
+    text = ed.buffer if current else buf.buffer
+    # Not recorded, like writer.append, so u does not bring back old results.
+    # The lines that earlier deltas changed are gone, so forget those too.
+    ed.splice(1, len(text), [], None if current else buf, record=False,
+              journaled=False)
+    if (ed.history if current else buf.history): # no history, keep none
+        buf.history = undo.History(ed.undolimit)
+        if current: ed.history = buf.history
+    buf.dot = 0
+    if current: ed.dot = 0
+
+def snapshots():
+    """
+    Return list of (bname, fname, lines) for each buffer to search.
+    lines is a copy of a list buffer, or a Rope snapshot, which copies only
+    its chunk lists, so the event loop does not decode a huge mapped file.
+    lines is None for a mapped buffer with no changes: search file fname.
+    """
+    ed.save_buffer() # so buffers includes the current buffer state
+    found = []
+    for bname, buf in ed.buffers.items():
+        if bname == results or buf.readonly:
+            continue
+        if buf.saved and mapped.is_mapped(buf.buffer):
+            lines = None
+        elif isinstance(buf.buffer, rope.Rope):
+            lines = buf.buffer.snapshot()
+        else:
+            lines = buf.buffer[:]
+        found.append((bname, buf.filename, lines))
+    return found
+
+async def searching(target, top, regex):
+    """
+    Search in worker processes, write hits to results buffer as they arrive.
+    Walk the directory tree in a thread, so the event loop does not wait.
+    """
+    global nhits
+    loop = asyncio.get_running_loop()
+    out = Writer(results)
+    nhits = 0
+    pool = concurrent.futures.ProcessPoolExecutor(workers)
+    try:
+        if top is None:
+            jobs = []
+            for bname, fname, lines in snapshots():
+                if lines is None: # workers read the file, not the buffer
+                    jobs.append(loop.run_in_executor(pool, search.grepfiles,
+                                                     [ fname ], target, regex))
+                    continue
+                if isinstance(lines, rope.Rope): # decode in a thread
+                    lines = await loop.run_in_executor(None, list, lines)
+                jobs.append(loop.run_in_executor(pool, search.greplines,
+                                                 bname, lines, target, regex))
+        else:
+            fnames = await loop.run_in_executor(None, search.walk, top)
+            jobs = [ loop.run_in_executor(pool, search.grepfiles,
+                                          fnames[i:i+batchsize], target, regex)
+                     for i in range(0, len(fnames), batchsize) ]
+        for job in asyncio.as_completed(jobs):
+            for name, iline, line in await job:
+                out.write(f'{name}:{iline}: {line}')
+                nhits += 1
+            await asyncio.sleep(0) # let the shell and editor run
+    except asyncio.CancelledError:
+        out.write(f'? search for {target!r} cancelled')
+        raise
+    finally: # don't wait for workers, that would block the event loop
+        pool.shutdown(wait=False, cancel_futures=True)
+    out.write(f'{nhits} hits for {target!r}')
+
+def agrep(target=None, top=None, regex=None):
+    """
+    Search for target in every file in directory tree top, or in every sked
+    buffer if top is None.  If regex is None, use sked.regex.
+    Hits are written to the results buffer as name:iline: line.
+    Return at once with the task, which runs in the piety event loop.
+    Without a running event loop, run the search to completion here.
+    """
+    global task
+    if not target: target = ed.searchstring
+    ed.searchstring = target
+    if regex is None: regex = ed.regex
+    try:
+        search.pattern(target, regex)
+    except re.error as error: # check here, not in each worker
+        print(f"? bad regular expression '{target}': {error}\n\r", end='')
+        return
+    cancel()
+    clear(results)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError: # no event loop, so we can't block one
+        asyncio.run(searching(target, top, regex))
+        return
+    task = loop.create_task(searching(target, top, regex))
+    task.add_done_callback(failed)
+    return task
+
+def failed(task):
+    'Done callback of search task, write its exception in results buffer'
+    if not task.cancelled() and task.exception(): # searching reports cancel
+        Writer(results).write(f'? search failed: {task.exception()!r}')
+
+def cancel():
+    'Cancel the search that is running, if any'
+    if task and not task.done():
+        task.cancel()
+
+def hit(iline=None):
+    """
+    Go to the hit on line iline in results buffer, default its dot.
+    Switch to the buffer named in the hit, or load the file, then move dot.
+    """
+    current = (ed.bufname == results)
+    if not current and results not in ed.buffers: # killed, or no search yet
+        print(f'? no results buffer {results}\n\r', end='')
+        return
+    text = ed.buffer if current else ed.buffers[results].buffer
+    if iline is None:
+        iline = ed.dot if current else ed.buffers[results].dot
+    m = hitline.match(text[iline]) if 0 < iline < len(text) else None
+    if not m:
+        print(f'? no hit at line {iline} in {results}\n\r', end='')
+        return
+    if current: ed.dot = iline
+    else: ed.buffers[results].dot = iline
+    name, nline = m.group(1), int(m.group(2))
+    bnames = [ bname for bname, buf in ed.buffers.items()
+               if name in (bname, buf.filename) ]
+    if name in (ed.bufname, ed.filename):
+        pass
+    elif bnames:
+        fr.b(bnames[0])
+    else:
+        fr.e(name)
+    fr.p(min(nline, ed.S()))
+
+def nexthit(step=1):
+    'Go to the next hit in results buffer, or previous if step is -1'
+    current = (ed.bufname == results)
+    if not current and results not in ed.buffers:
+        print(f'? no results buffer {results}\n\r', end='')
+        return
+    dot = ed.dot if current else ed.buffers[results].dot
+    hit(dot + step)
+
+def prevhit():
+    'Go to the previous hit in results buffer'
+    nexthit(-1)
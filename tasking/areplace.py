@@ -0,0 +1,264 @@
+"""
+areplace.py - Replace a string in every file in a directory tree, in worker
+              processes, while the shell and editor keep running.
+              First count the matches in each file, then apply on command.
+
+Usage, at the pysh prompt in a Piety session:
+
+  areplace('old_name', 'new_name', '.') # count matches in files in tree .
+  apply()         # replace in the files listed in the results buffer
+  cancel()        # stop counting or applying
+
+The counts appear in the results buffer as they are found, one line for
+each file.  Delete lines from the results buffer to skip those files.
+
+apply replaces in all the listed files or in none.  Workers write the new
+contents of each file to a staged copy next to it.  Only when every file is
+staged does apply rename the staged copies over the files, with no other
+task running in between.  If any file can't be staged, or apply is
+cancelled, the staged copies are removed and no file changes.  Each file
+is moved aside to a backup before its staged copy replaces it, so if a
+rename fails, the files already replaced are restored from their backups.
+
+Files that are open in an editor buffer are not rewritten.  Their buffers
+are changed in place instead, like the sked c(hange) command, so they keep
+their dot, unsaved edits and index.  Save them with w as usual.  Buffers
+are changed right after the renames, with no task running in between,
+and only if all the renames succeed.
+
+See README.md for more notes.
+"""
+
+import os, re, asyncio, concurrent.futures
+import sked as ed
+import display
+import edsel as fr  # short for 'frame'
+import search
+import agrep # for clear
+import writer
+from writer import Writer
+
+# Define and initialize global variables used by this module,
+# but only the *first* time this module is imported.
+try:
+    _ = results # if this variable is defined, then module was already imported
+except:
+    results = 'replace.txt' # name of results buffer
+    workers = None   # N of worker processes, None means N of processors
+    batchsize = 16   # N of files in each job sent to a worker
+    suffix = '.replace~' # staged copy of file fname is fname + suffix
+    backup = '.orig~'    # file fname is moved aside here while committing
+    task = None      # asyncio task for the count or apply that is running
+    pending = None   # (old, new, regex) from most recent areplace, for apply
+
+countline = re.compile(r'^\s*(\d+) (.*)\n') # count fname, as written below
+
+def opened():
+    'Return dict from absolute path of each file open in a buffer to bufname'
+    ed.save_buffer() # so buffers includes the current buffer state
+    return { os.path.abspath(buf.filename): bname
+             for bname, buf in ed.buffers.items()
+             if bname != results and not buf.readonly }
+
+def text(bname):
+    'Return lines in buffer bname, current buffer might differ from saved'
+    return ed.buffer if bname == ed.bufname else ed.buffers[bname].buffer
+
+def batches(fnames):
+    'Return list of lists of file names, batchsize files in each list'
+    return [ fnames[i:i+batchsize] for i in range(0, len(fnames), batchsize) ]
+
+async def counting(old, new, top, regex):
+    'Count matches in worker processes, write counts to results buffer'
+    loop = asyncio.get_running_loop()
+    out = Writer(results)
+    nfiles = nmatches = 0
+    pool = concurrent.futures.ProcessPoolExecutor(workers)
+    try:
+        fnames = await loop.run_in_executor(None, search.walk, top)
+        buffers = opened()
+        pat = search.pattern(old, regex)
+        for fname in fnames: # open buffers, count in the buffer not the file
+            bname = buffers.get(os.path.abspath(fname))
+            if bname:
+                _, count = search.substitute(text(bname), pat, new, regex, 1)
+                if count:
+                    out.write('%5d %s' % (count, fname))
+                    nfiles, nmatches = nfiles + 1, nmatches + count
+        jobs = [ loop.run_in_executor(pool, search.countfiles, batch,
+                                      old, new, regex)
+                 for batch in batches([ fname for fname in fnames
+                     if os.path.abspath(fname) not in buffers ]) ]
+        for job in asyncio.as_completed(jobs):
+            for fname, count in await job:
+                out.write('%5d %s' % (count, fname))
+                nfiles, nmatches = nfiles + 1, nmatches + count
+            await asyncio.sleep(0) # let the shell and editor run
+    except asyncio.CancelledError:
+        out.write(f'# count of {old!r} cancelled')
+        raise
+    finally: # don't wait for workers, that would block the event loop
+        pool.shutdown(wait=False, cancel_futures=True)
+    out.write(f'# {nmatches} matches in {nfiles} files, apply() to replace')
+
+def areplace(old=None, new=None, top='.', regex=None):
+    """
+    Count matches of old in every file in directory tree top, show counts
+    in results buffer.  Then apply() replaces old with new in those files.
+    If regex is None, use sked.regex.  Return at once with the task.
+    Without a running event loop, count to completion here.
+    """
+    global task, pending
+    if not old: old = ed.searchstring
+    if new is None: new = ed.replacestring
+    ed.searchstring, ed.replacestring = old, new
+    if regex is None: regex = ed.regex
+    try:
+        search.pattern(old, regex)
+    except re.error as error: # check here, not in each worker
+        print(f"? bad regular expression '{old}': {error}\n\r", end='')
+        return
+    cancel()
+    agrep.clear(results)
+    pending = (old, new, regex)
+    return start(counting(old, new, top, regex))
+
+def discard(pool, fnames):
+    'Wait for workers to finish, then remove any staged copies of fnames'
+    pool.shutdown(wait=True, cancel_futures=True)
+    for fname in fnames:
+        try:
+            os.remove(fname + suffix)
+        except OSError:
+            pass
+
+def commit(fnames, out):
+    """
+    Rename the staged copy of each file in fnames over the file.  Move each
+    file aside to a backup first.  If any rename fails, put back the files
+    already replaced, remove the staged copies, then raise the OSError.
+    Write to out, a Writer, any file that could not be put back.
+    """
+    replaced = [] # files moved aside to fname + backup
+    try:
+        for fname in fnames:
+            os.replace(fname, fname + backup)
+            replaced.append(fname)
+            os.replace(fname + suffix, fname)
+    except OSError:
+        for fname in reversed(replaced):
+            try:
+                os.replace(fname + backup, fname)
+            except OSError as error: # report it, keep restoring the others
+                out.write(f'? {fname} changed, original is in '
+                          f'{fname + backup}: {error}')
+        for fname in fnames:
+            try:
+                os.remove(fname + suffix)
+            except OSError:
+                pass
+        raise
+    for fname in fnames:
+        try:
+            os.remove(fname + backup)
+        except OSError:
+            pass
+
+def listed():
+    'Return list of file names in results buffer'
+    lines = text(results)[1:] if results in ed.buffers else []
+    return [ m.group(2) for m in map(countline.match, lines) if m ]
+
+async def applying(old, new, regex):
+    'Stage files in worker processes, then rename them and change buffers'
+    loop = asyncio.get_running_loop()
+    out = Writer(results)
+    fnames = listed()
+    buffers = opened()
+    files = [ fname for fname in fnames
+              if os.path.abspath(fname) not in buffers ]
+    staged = []
+    pool = concurrent.futures.ProcessPoolExecutor(workers)
+    try:
+        jobs = [ loop.run_in_executor(pool, search.stagefiles, batch,
+                                      old, new, regex, suffix)
+                 for batch in batches(files) ]
+        for job in asyncio.as_completed(jobs):
+            staged += await job
+    except (Exception, asyncio.CancelledError) as error:
+        loop.run_in_executor(None, discard, pool, files) # doesn't block loop
+        out.write(f'? replace {old!r} stopped, no files changed: {error}')
+        if isinstance(error, asyncio.CancelledError):
+            raise
+        return
+    pool.shutdown(wait=False)
+    # Commit.  No await from here on, so no other task runs until we finish,
+    # and buffers change in the same step as files, or not at all.
+    staged = [ (fname, count) for fname, count in staged if count ]
+    try:
+        commit([ fname for fname, count in staged ], out)
+    except OSError as error:
+        out.write(f'? replace {old!r} stopped, no files changed: {error}')
+        return
+    nfiles = len(staged)
+    nmatches = sum(count for fname, count in staged)
+    pat = search.pattern(old, regex)
+    ed.checkpoint() # undo the replacement in buffers by itself, not with
+    replaced = []   # the user's last command, like writer.append
+    for fname in fnames: # open buffers, change in place
+        bname = buffers.get(os.path.abspath(fname))
+        if not bname:
+            continue
+        current = (bname == ed.bufname)
+        changed, count = search.substitute(text(bname), pat, new, regex, 1)
+        fr.watch(bname) # so each change marks rows in its windows dirty
+        for iline, line in changed:
+            ed.splice(iline, iline+1, [ line ],
+                      None if current else ed.buffers[bname])
+        if count:
+            if current: ed.saved = False
+            ed.buffers[bname].saved = False
+            nfiles, nmatches = nfiles + 1, nmatches + count
+            replaced.append(bname)
+    ed.checkpoint() # the user's next command starts a new group
+    if replaced:
+        with display.frame(): # redraw every window that shows a changed buffer
+            if ed.bufname in replaced: # focus window shows current buffer
+                writer.refresh()
+                fr.put_status(fr.focus, ed.status(), fr.wbottom(),
+                              fr.winleft, fr.wwidth)
+            fr.repaint()
+            writer.restore_cursor()
+    out.write(f'# replaced {nmatches} in {nfiles} files')
+
+def apply():
+    """
+    Replace in every file listed in results buffer, or in none.
+    Return at once with the task.
+    """
+    global pending
+    if not pending:
+        print('? no replacement pending, first call areplace\n\r', end='')
+        return
+    if task and not task.done():
+        print('? wait for areplace to finish, or cancel it\n\r', end='')
+        return
+    old, new, regex = pending
+    pending = None # don't apply the same replacement twice
+    return start(applying(old, new, regex))
+
+def start(coroutine):
+    'Run coroutine as task in the event loop, or to completion if none'
+    global task
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError: # no event loop, so we can't block one
+        asyncio.run(coroutine)
+        return
+    task = loop.create_task(coroutine)
+    return task
+
+def cancel():
+    'Cancel counting or applying, if running'
+    if task and not task.done():
+        task.cancel()
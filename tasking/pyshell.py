@@ -121,7 +121,8 @@ def runcmd(c):
             point = len(cmd)
             el.refresh(cmd, point, start_col)
         else:
-            cmd, point = el.runcmd(k, cmd, point, start_col) # edit cmd
+            with display.frame(): # one write for the whole edit
+                cmd, point = el.runcmd(k, cmd, point, start_col) # edit cmd
  
 def pysh():
     """
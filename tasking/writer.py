@@ -5,50 +5,69 @@ writer.py - Functions that put text into editor buffers and windows,
 See writer.txt for more notes and explanation. 
 """
 
-import display
+import time, asyncio, collections, threading
+import display, screen
 import sked as ed
 import edsel as fr  # short for 'frame'
 import editline as el
+import dmacs as dm
 import pmacs as pm
 import pyshell as sh
 
+# Define and initialize global variables used by this module,
+# but only the *first* time this module is imported.
+try:
+    _ = fps # if this variable is defined, then module was already imported
+except:
+    fps = 30      # most redraws each second, 0 redraws after each line
+    dirty = {}    # names of buffers written since last redraw, to others, see show
+    timer = None  # loop.call_later handle for the next redraw, if any
+    last = 0.0    # loop.time() of the last redraw
+    try:
+        loop = asyncio.get_running_loop() # imported in a task in the loop
+    except RuntimeError:
+        loop = None # event loop where buffers are changed, see find_loop
+    direct = False # True: no loop in this session, threads append themselves
+    queue = collections.deque() # (bname, lines, others) posted by threads
+    waking = False # True when drain is scheduled in loop, not yet started
+
 # Redefine these functions from edsel to also restore cursor to point
  
 def restore_cursor_to_cmdline():
-    'Unlike version in edsel, this version also sets column to point'
-    fr.restore_cursor_to_cmdline() # puts cursor in col 1
+    """
+    Unlike version in edsel, this version also sets column to point,
+    and does not call display.flush, which would wait for the terminal.
+    """
+    screen.flush()
+    display.put_cursor(fr.tlines, 1)
     el.move_to_point(sh.point, sh.start_col)    
 
-saved_focus = -1 # index of focus window *before* we switch to print tick msg
-
 def restore_cursor():
-    ## sh.cmd_mode = False # DEBUG for testing n_windows() == 2 case from REPL
+    """
+    Send changes in the frame, then put the cursor back where the user
+    is typing: the pysh command line or point in the focus window.
+    """
+    screen.flush()
+    # If terminal is behind, flush sent nothing, so cursor did not move.
+    # Don't queue more output, screen sends the latest lines later.
+    if display.busy():
+        return
     if sh.cmd_mode: # editing/running Python commands at pysh REPL
-        restore_cursor_to_cmdline() # redefined above, not the version in edsel
-    # This next case assumes other window is tocus window that needs restoring
-    # BUT if current window is intended focus window, this switches focus away
-    elif fr.n_windows() == 2: # HACK only works in this n == 2 special case
-        ## display.putstr(f'SWITCH WINDOW from {ed.bufname}') # DEBUG
-        fr.save_window(fr.focus) 
-        fr.focus = saved_focus
-        fr.restore_window(saved_focus)
+        restore_cursor_to_cmdline() # redefined above, not edsel version
+    else: # pmacs is editing in the focus window
         pm.restore_cursor_to_window()
-        ## display.putstr(f'AT POINT in {ed.bufname}') # DEBUG
-    else: # There is no other window, cursor is already where it is needed.
-        pass 
 
 # Local refresh and recenter in this module are copied from edsel
 # except here refresh does not call update_status 
 # so it doesn't call restore_cursor_to_cmdline, which we don't want.
+# Callers send the changes to the display with restore_cursor.
 
 def refresh():
     """
     Refresh the focus window.
     (Re)Display lines from segment, marker, status without moving segment.
     """
-    display.put_cursor(fr.wintop, 1) # top line in window
-    fr.erase_lines(fr.wheight-1) # erase entire window contents above status line
-    fr.update_window() # FIXME did we really have to erase_lines before this?
+    fr.update_window()
     fr.put_marker(ed.dot, display.white_bg)
     # fr.update_status() # NOT! we don't want restore_cursor_to_cmdline
     
@@ -58,20 +77,193 @@ def recenter():
     fr.buftop = fr.locate_segment(ed.dot)
     refresh() # redefined above, not the version in edsel
 
+def draw():
+    """
+    Show the end of the current buffer in the focus window.
+    When dot is just below the window, scroll up to show it at the bottom,
+    so only the new lines are drawn.  Then restore the cursor.
+    """
+    ed.dot = ed.S() # last line in buffer, which we just added
+    nbelow = ed.dot - (fr.buftop + fr.wheight - 2) # N of lines below window
+    if fr.in_window(ed.dot):
+        refresh() # screen only sends the lines that changed
+    elif 0 < nbelow < fr.wheight - 1:
+        fr.scroll(nbelow)
+        refresh()
+    else:
+        recenter() # redefined above, not the version in edsel
+    restore_cursor()
+
+def show(bname, others):
+    """
+    Redraw buffer bname in the focus window, if it is there.  If others,
+    also redraw it in the other windows that show it, directly, without
+    switching focus or the current buffer, see edsel.follow.
+    """
+    if bname == ed.bufname: # assumes focus window shows current buffer
+        draw()
+    if not others:
+        return
+    wkeys = [ wk for wk in fr.visible(bname) if wk != fr.focus ]
+    if wkeys and bname in ed.buffers:
+        text = ed.buffer if bname == ed.bufname else ed.buffers[bname].buffer
+        for wk in wkeys:
+            fr.follow(wk, len(text)-1) # show the end, where we just appended
+        restore_cursor()
+
+def redraw():
+    'Redraw the windows of buffers written since the last redraw'
+    global timer, last
+    timer = None
+    try:
+        last = asyncio.get_running_loop().time()
+    except RuntimeError:
+        pass
+    buffers = dict(dirty)
+    dirty.clear()
+    with display.frame(): # one write, so background output is cheap
+        for bname, others in buffers.items():
+            show(bname, others)
+
+def schedule(bname, others=False):
+    """
+    Mark buffer bname dirty, redraw it at most fps times a second.
+    Without a running event loop, or if fps is 0, redraw now.
+    """
+    global timer
+    dirty[bname] = dirty.get(bname, False) or others
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if not loop or not fps:
+        redraw()
+    elif not timer:
+        delay = max(0, last + 1/fps - loop.time())
+        timer = loop.call_later(delay, redraw)
+
+def tolines(line):
+    'Return list of buffer lines for line written by print, maybe empty'
+    text = line.strip('\n\r') # line might end with \n, \r\n or \n\r
+    if not text: # redirect_stdout and file=... append extra \n
+        return []
+    return [ text + '\n' ]
+
+def moved(bname, nlines):
+    """
+    Lines in buffer bname moved up nlines because sked.trim deleted the
+    oldest lines, so move up the line numbers that windows and mark keep.
+    """
+    for win in fr.windows.values():
+        if win.bufname == bname:
+            win.buftop = max(win.buftop - nlines, 1)
+            win.dot = max(win.dot - nlines, 1)
+    if bname == ed.bufname: # focus window shows current buffer
+        fr.buftop = max(fr.buftop - nlines, 1)
+        if dm.mark: dm.mark = max(dm.mark - nlines, 1) # 0 means no mark
+
+def append(bname, lines):
+    """
+    Append lines, each ending with \n, to end of buffer bname, which might
+    not be the current buffer, all in one splice.
+    If the buffer has maxlines, delete its oldest lines, see sked.ring.
+    Return False if there is no buffer bname or nothing to append.
+    """
+    if not lines or bname not in ed.buffers:
+        return False
+    # bname may not be ed.bufname, named buffer may not be current buffer
+    buf = ed.buffers[bname]
+    current = (bname == ed.bufname)
+    text = ed.buffer if current else buf.buffer
+    end = len(text) # append after last line in buffer
+    # current buffer items might differ from saved, so splice current
+    # Not recorded for undo or journal: u undoes and recover replays the
+    # user's commands, not the output of tasks.  Lines appended at the end
+    # don't move earlier deltas.
+    ed.splice(end, end, lines, None if current else buf, record=False,
+              journaled=False)
+    buf.dot = len(text)-1
+    # Current buffer text lines are the same as text lines in saved buffers
+    # BUT current buffer dot might not be the same, so must assign here
+    if current: ed.dot = ed.S()
+    ndeleted = ed.trim(None if current else buf) # also moves dot up
+    if ndeleted: moved(bname, ndeleted)
+    return True
+
+def drain():
+    """
+    In the event loop, append the lines that other threads posted,
+    all the lines for each buffer in one splice, then schedule redraws.
+    """
+    global waking
+    waking = False # a thread that posts after this wakes us again
+    batches = {} # bname to [lines, others], in order of first post
+    while queue:
+        bname, lines, others = queue.popleft()
+        batch = batches.setdefault(bname, [[], False])
+        batch[0] += lines
+        batch[1] = batch[1] or others
+    for bname, (lines, others) in batches.items():
+        if append(bname, lines):
+            schedule(bname, others)
+
+def find_loop():
+    """
+    Return the event loop running in this thread, or None.
+    The first call in the loop thread makes it the loop where
+    buffers are changed, see post.  piety also assigns loop.
+    """
+    global loop
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError: # not in the event loop thread
+        return None
+    loop = running
+    return running
+
+def post(bname, lines, others=False):
+    """
+    Append lines to buffer bname and schedule a redraw, from any thread.
+    In the event loop, or in the main thread when no loop is running,
+    do it now, in a frame.  From another thread, only the loop may touch
+    buffers and display, so add lines to the queue and wake the loop to
+    drain it.  deque.append needs no lock, and many posts make one wakeup,
+    so threads can write at a high rate.  If no loop is known yet, lines
+    wait in the queue until the loop or the main thread posts or drains.
+    With direct = True, as in the tm session where no loop ever runs,
+    threads append themselves, in a frame so they take turns.
+    """
+    global waking
+    if not lines:
+        return
+    running = find_loop()
+    if not running and threading.current_thread() is not threading.main_thread():
+        if loop and loop.is_running():
+            queue.append((bname, lines, others))
+            if not waking:
+                waking = True
+                try:
+                    loop.call_soon_threadsafe(drain)
+                except RuntimeError: # loop closed after is_running
+                    waking = False
+            return
+        if not direct:
+            queue.append((bname, lines, others))
+            return
+    with display.frame():
+        if queue: # posted earlier by threads, append those first
+            drain()
+        if append(bname, lines):
+            schedule(bname, others)
+
 def write(line):
     """
     Append line to end of current sked buffer and display in edsel focus window.
     line is a string that does not end with \n, this write() adds it.
+    The buffer changes now, the window is redrawn by schedule.
+    Threads can call this, see post.
     """
-    if line not in ('', '\n'): # redirect_stdout and file=... append extra \n
-        ed.buffer.append(line.rstrip('\n\r') + '\n') # line might have many \n
-        ed.dot = ed.S()  # last line in buffer, which we just added.
-        if fr.in_window(ed.dot):
-            display.put_cursor(fr.wline(ed.dot), 1)
-            display.putstr(line[:fr.tcols])
-        else:
-            recenter() # redefined above, not the version in edsel
-        restore_cursor()
+    post(ed.bufname, tolines(line))
 
 def writebuf(bname, line):
     """
@@ -80,47 +272,19 @@ def writebuf(bname, line):
     If the named buffer is visible in the focus window, update that window.
     line is a string that does not end with \n, this function adds it.
     """
-    if line not in ('', '\n'): # redirect_stdout and file=... append extra \n
-        if bname in ed.buffers:
-            # bname may not be ed.bufname, named buffer may not be current buffer
-            ed.buffers[bname]['buffer'].append(line.rstrip('\n\r') + '\n')
-            ed.buffers[bname]['dot'] = len(ed.buffers[bname]['buffer'])-1
-            # Current buffer text lines are the same as text lines in saved buffers
-            # BUT current buffer dot might not be the same, so must assign here
-            if bname == ed.bufname: ed.dot = ed.S()
-            # If the named buffer is visible in the focus window, update that window
-            # Focus window dot might not be at the end of the buffer
-            if bname == ed.bufname: # name of current buffer
-                if fr.in_window(ed.dot): # assumes focus window shows current buffer
-                    display.put_cursor(fr.wline(ed.dot), 1)
-                    display.putstr(line[:fr.tcols])
-                else:
-                    recenter() # redefined above, not the version in edsel
-                restore_cursor()
+    post(bname, tolines(line))
     
 def writebuf_show(bname, line):
     """
-    Call writebuf to update buffer bname with line.
-    If buffer bname is in focus window, called writebuf will display it.
-    If buffer bname is in a window that is not the focus window, first make
-     that the focus window, then call writebuf to update buffer and display it.
-    If buffer bname is not in a window on the display, writebuf will update
-     it but not display it.
-    If buffer bname is not in buffers, writebuf does not attempt to update it.
-    """
-    global saved_focus # index of focus window before weswitch to print tick msg
-    wk = -1  # can't be a window key
-    # search for key of window that shows buffer bname
-    for wk in fr.windows: # wk is integer window key
-        if fr.windows[wk]['bufname'] == bname:
-            break
-    # if window with named buffer found, change focus - based on fr.on code
-    if wk in fr.wkeys and wk != fr.focus:  # if not found, wk is still -1
-        fr.save_window(fr.focus) 
-        saved_focus = fr.focus
-        fr.focus = fr.wkeys[wk]
-        fr.restore_window(wk)
-    writebuf(bname, line)
+    Update buffer bname with line, like writebuf.
+    If buffer bname is in focus window, redraw will display it.
+    If buffer bname is in a window that is not the focus window, redraw
+     displays it there too, without changing focus or the current buffer.
+    If buffer bname is not in a window on the display, it is updated
+     but not displayed.
+    If buffer bname is not in buffers, it is not updated.
+    """
+    post(bname, tolines(line), others=True)
 
 class Writer():
     """
@@ -128,7 +292,66 @@ class Writer():
     Our buffers are just dicts not objects so they have no write method.
     Usage:  abuf = Writer('a.txt')  then: with redirect_stdout(abuf) as buf: ...
     Recall that a is the name of the sked/edsel append fcn, can't use a = ..
+
+    With lines=N or seconds=T, collect lines and append them all in one
+    splice, when N lines are waiting, T seconds after the first of them,
+    or when flush is called.  Then the window is redrawn once.
+    Collected text is split into lines at each \n, like a file, so
+    print with many args makes one line here, not one line for each write.
+    Usage:  with Writer('a.txt', lines=100) as abuf, redirect_stdout(abuf): ...
+
+    With maxlines=N, the buffer keeps only its last N lines, see sked.ring.
     """
-    def __init__(self, bufname): self.bufname = bufname
-    def write(self, line): writebuf_show(self.bufname, line)
+    def __init__(self, bufname, lines=0, seconds=None, maxlines=None):
+        find_loop() # made in the loop, so threads that write later queue
+        self.bufname = bufname
+        if maxlines and bufname in ed.buffers: # keep only the last maxlines
+            ed.ring(maxlines, bufname)
+        self.lines = lines     # flush when this many lines are waiting
+        self.seconds = seconds # flush this long after first line waiting
+        self.pending = []      # lines waiting to be appended
+        self.partial = ''      # text written after the last \n
+        self.since = None      # time.monotonic() of first line waiting
+        self.timer = None      # loop.call_later handle to flush, if any
+
+    def write(self, line):
+        if not (self.lines or self.seconds): # not buffered
+            writebuf_show(self.bufname, line)
+            return
+        # \r\n and \n\r both end one line, so strip \r from both ends
+        *lines, self.partial = (self.partial + line).split('\n')
+        self.pending += [ text.strip('\r') + '\n' for text in lines ]
+        if not self.pending:
+            return
+        if self.since is None:
+            self.since = time.monotonic()
+            if self.seconds:
+                try: # send even if no more lines are written
+                    loop = asyncio.get_running_loop()
+                    self.timer = loop.call_later(self.seconds, self.send)
+                except RuntimeError: # no event loop, check in each write
+                    pass
+        if ((self.lines and len(self.pending) >= self.lines) or
+            (self.seconds and time.monotonic() - self.since >= self.seconds)):
+            self.send()
+
+    def send(self):
+        'Append all waiting lines to the buffer in one splice, then redraw'
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        self.since = None
+        lines, self.pending = self.pending, []
+        if lines:
+            post(self.bufname, lines, others=True)
+
+    def flush(self):
+        'Send waiting lines, and any text after the last \n as a line'
+        partial, self.partial = self.partial.strip('\r'), ''
+        if partial: # not just the \r of a \n\r line end
+            self.pending.append(partial + '\n')
+        self.send()
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.flush()
     
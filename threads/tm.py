@@ -15,6 +15,7 @@ from pmacs import pm, rpm # use rpm when starting from pysh instead of >>>
 import pyshell
 from pyshell import pysh, tpm # from pysh, use tpm not rpm to clear cmd_mode
 import writer # for tasks
+writer.direct = True # no event loop here, so threads append and draw themselves
 from writer import *
 import timers # for tasks         
 from timers import *
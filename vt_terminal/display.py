@@ -1,13 +1,39 @@
 """
 display - Update the terminal display using ANSI control sequences.
+
+In the asyncio event loop, output never blocks: write queues what the
+tty does not accept at once and loop.add_writer sends it when the tty is
+ready.  When more than limit chars are queued, busy() is True, and screen
+holds its changes until the queue drains, then sends only the latest.
 """
 
 # This putstr always writes to display even when stdout is redirected
 
-import os
+import os, asyncio, contextlib, threading
 
 ttyname = os.ctermid() # usually returns '/dev/tty'
-tty = open(ttyname, 'w')
+tty = open(ttyname, 'w', errors='replace') # show undecodable bytes as ?
+
+# Define and initialize global variables used by this module,
+# but only the *first* time this module is imported.
+try:
+    _ = pending # if this variable is defined, module was already imported
+except:
+    coalesce = True # False: putstr always writes at once, for debugging
+    frames = 0      # depth of nested frame() blocks now running
+    pending = []    # strings collected by putstr in frame(), not yet written
+    region = None   # (top, bottom) lines of scrolling region, None all lines
+    cursor = None   # (line, column) of cursor if known, None if unknown
+    columns = 80    # width of display in columns, edsel.win assigns it
+    sent = 0        # N of chars written to tty, see report
+    saved = 0       # N of chars motion saved, compared to cup for every move
+    nonblocking = True # False: always write to tty and wait, like outside loop
+    fd = None       # tty opened again, non-blocking, for the event loop
+    queue = []      # bytes not yet accepted by the non-blocking tty
+    limit = 1 << 16 # busy() when more than this many bytes are queued
+    waiting = None  # event loop that waits in add_writer for tty, if any
+    drained = []    # functions to call once when queue is empty, see drain
+    lock = threading.RLock() # held in frame(), so threads draw one at a time
 
 # Differs from terminal.putstr which writes to stdout and might be redirected
 def putstr(s):
@@ -16,8 +42,182 @@ def putstr(s):
     formatting (unlike plain Python print).  Flush to force output immediately.
     If you want newline, you must explicitly include it in s.
     Always print to tty (terminal) device even when stdout is redirected.
+    Inside frame(), only collect s, the frame writes it at the end.
+    Afterwards cursor is unknown, callers that know where it is assign it.
+    """
+    global cursor
+    cursor = None
+    if frames and coalesce:
+        pending.append(s)
+    else:
+        write(s)
+
+def write_pending():
+    'Write all strings collected by putstr in one write'
+    if pending:
+        s = ''.join(pending)
+        pending.clear()
+        write(s)
+
+def write(s):
+    """
+    Write s to tty.  Outside the event loop, wait until tty accepts it.
+    In the event loop, never wait: queue s and drain the queue.
+    """
+    global sent
+    sent += len(s)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError: # no event loop, so we can't block one
+        finish()
+        tty.write(s)
+        tty.flush()
+        return
+    if not nonblocking:
+        finish()
+        tty.write(s)
+        tty.flush()
+        return
+    queue.append(s.encode(tty.encoding, tty.errors))
+    if not waiting: # else loop calls drain when tty is ready
+        drain()
+
+def drain():
+    """
+    Write as much of queue as the tty accepts now, without waiting.
+    If any is left, ask the event loop to call drain again when tty is
+    ready.  When queue is empty, call each function in drained, once.
+    """
+    global fd, waiting
+    if fd is None:
+        fd = os.open(ttyname, os.O_WRONLY | os.O_NONBLOCK)
+    while queue:
+        try:
+            n = os.write(fd, queue[0])
+        except BlockingIOError:
+            break
+        if n < len(queue[0]):
+            queue[0] = queue[0][n:]
+            break
+        queue.pop(0)
+    if queue and not waiting:
+        waiting = asyncio.get_running_loop()
+        waiting.add_writer(fd, drain)
+    elif not queue:
+        if waiting:
+            waiting.remove_writer(fd)
+            waiting = None
+        callbacks = drained[:]
+        drained.clear()
+        for callback in callbacks:
+            callback()
+
+def busy():
+    'Return True when tty is behind, so callers can hold back output'
+    return sum(map(len, queue)) > limit
+
+def when_drained(callback):
+    'Call callback once, when the queue is empty, see drain'
+    if callback not in drained:
+        drained.append(callback)
+
+def unwait():
+    """
+    Stop the event loop waiting for tty to call drain.  finish can run in
+    a thread without the loop, but only the loop thread may remove its
+    writer, so from another thread ask the loop to do it, unless drain
+    waits again by then.
+    """
+    global waiting
+    loop, waiting = waiting, None
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError: # not in the event loop thread
+        running = None
+    if running is loop:
+        loop.remove_writer(fd)
+        return
+    def remove():
+        if waiting is not loop: # drain did not add the writer again
+            loop.remove_writer(fd)
+    try:
+        loop.call_soon_threadsafe(remove)
+    except RuntimeError: # loop is closed, it has no writers
+        pass
+
+def finish():
+    'Write everything in the queue, waiting for tty if needed'
+    while queue or drained: # callbacks might queue more
+        if waiting:
+            unwait()
+        data = b''.join(queue)
+        queue.clear()
+        if data:
+            tty.flush()
+            tty.buffer.write(data)
+            tty.buffer.flush()
+        callbacks = drained[:]
+        drained.clear()
+        for callback in callbacks:
+            callback()
+
+def flush():
+    """
+    Write all strings collected by putstr in one write, now.
+    Call before anything else writes on the terminal, like print or input.
+    This waits for tty to accept anything queued, so output stays in order.
+    So cursor is unknown after this.
+    """
+    global cursor
+    write_pending()
+    finish()
+    cursor = None
+
+def send():
+    """
+    Like flush, but in the event loop do not wait for tty: what it does not
+    accept now stays queued, and drain sends it when tty is ready.
     """
-    print(s, end='', flush=True, file=tty)
+    global cursor
+    write_pending()
+    cursor = None
+
+@contextlib.contextmanager
+def frame():
+    """
+    Collect putstr output in the with block, write it all at the end in one
+    write, so one command or callback makes one system call not dozens.
+    Frames can nest, the outermost writes.
+    Cursor motion only trusts the cursor position it tracked in this frame,
+    because print, input or another program may have moved it before.
+    Holds lock, so a thread that draws waits until other frames finish.
+    """
+    global frames, cursor
+    with lock:
+        if not frames:
+            cursor = None
+        frames += 1
+        try:
+            yield
+        finally:
+            frames -= 1
+            if not frames:
+                write_pending()
+
+@contextlib.contextmanager
+def discarded():
+    """
+    Discard what putstr collects in the with block, for code that writes
+    on the display when the caller draws the same change another way.
+    Only inside frame(), where putstr collects, see putstr.
+    """
+    global cursor
+    n = len(pending)
+    try:
+        yield
+    finally:
+        del pending[n:]
+        cursor = None # discarded output might have moved it
 
 esc = '\x1B'     # \e does not work 'invalid \x escape'
 csi = esc+'['    # ANSI control sequence introducer
@@ -38,6 +238,10 @@ decstbm = csi+'%d;%dr' # DEC Set Top Bottom Margins (set scrolling region
                  # %d,%d is top, bottom, so 23;24 is bottom two lines
                  # then it sets cursor at the top of the page
 decstbmn  = csi+';r' # decstbm default: set scrolling region to full screen
+ind = esc+'D'    # index, cursor down, at bottom of region scroll it up
+ri  = esc+'M'    # reverse index, cursor up, at top of region scroll it down
+decsc = esc+'7'  # save cursor position and attributes
+decrc = esc+'8'  # restore cursor position and attributes saved by decsc
 
 sgr = csi + '%s' + 'm' # set graphic rendition. %s is ;-separated integers like
                  # bold+inverse: esc[0;1;7m by sgr % ';'.join('017')
@@ -47,6 +251,12 @@ clear = 0        # clears attributes (not transparent!)
 white_bg = 47    # gray on mac terminal
 bold = 1
 blink = 5
+red = 31         # foreground colors, used by highlight
+green = 32
+yellow = 33
+blue = 34
+magenta = 35
+cyan = 36
 
 def attrs(*attributes):
     """
@@ -62,35 +272,123 @@ def render(text, *attributes):
     """
     putstr(sgr % attrs(*attributes) + text + sgr % attrs(clear))
 
+# cursor motion
+
+def moved(at, ncols):
+    """
+    Cursor was at (line, column) before the last putstr, or None.
+    Now it is ncols to the right, or left if ncols < 0.
+    At the right edge the terminal might wrap, so cursor is unknown there.
+    """
+    global cursor
+    if at and 1 <= at[1] + ncols <= columns:
+        cursor = (at[0], at[1] + ncols)
+
+def zone(line):
+    'Return -1 if line is above scrolling region, 0 if in it, 1 if below'
+    if not region or region[0] <= line <= region[1]:
+        return 0
+    return -1 if line < region[0] else 1
+
+def horizontal(at, column, text=None):
+    """
+    Return shortest string that moves cursor along its line from column at
+    to column.  If text is given, it displays the cells from at to column,
+    so writing it again also moves the cursor there.
+    """
+    n = column - at
+    if n == 0:
+        return ''
+    moves = [ cha % column ]
+    if n > 0:
+        moves.append(cuf if n == 1 else csi + '%dC' % n)
+        if text is not None:
+            moves.append(text)
+    else:
+        moves.append('\b' * -n) # backspace moves left one column
+        moves.append(cub if n == -1 else csi + '%dD' % -n)
+    return min(moves, key=len)
+
+def motion(at, line, column, text=None):
+    """
+    Return shortest string that moves cursor from at to line, column.
+    at is (line, column) or None if cursor is unknown, then use cup.
+    If text is given, see horizontal.  Add chars saved to saved.
+    Relative up and down moves stop at the edges of the scrolling region,
+    so only use them when both lines are on the same side of its edges.
+    """
+    global saved
+    absolute = cup % (line, column)
+    moves = [ csi + '%dH' % line if column == 1 else absolute ]
+    if at and at[0] == line:
+        moves.append(horizontal(at[1], column, text))
+        moves.append('\r' + horizontal(1, column))
+    elif at and zone(at[0]) == zone(line):
+        n = line - at[0]
+        if n > 0:
+            vertical = csi + 'B' if n == 1 else csi + '%dB' % n
+        else:
+            vertical = csi + 'A' if n == -1 else csi + '%dA' % -n
+        moves.append(vertical + horizontal(at[1], column))
+        moves.append('\r' + vertical + horizontal(1, column))
+    best = min(moves, key=len)
+    saved += len(absolute) - len(best)
+    return best
+
+def report():
+    'Print N of chars sent to display, and N saved by cursor motion'
+    print(f'{sent} chars sent to display, {saved} saved by cursor motion\n\r',
+          end='')
+
 # used by line
 
 def insert_char(key):
     'Insert character in front of cursor'
+    at = cursor
     putstr((ich % 1) + key) # open space to insert char
+    moved(at, 1)
 
 def insert_string(string):
+    at = cursor
     putstr((ich % len(string)) + string)
+    moved(at, len(string))
 
 def delete_char():
     'Delete character under the cursor'
+    at = cursor
     putstr(dch % 1)
+    moved(at, 0)
 
 def delete_nchars(n):
     'Delete n characters under, then after the cursor'
+    at = cursor
     putstr(dch % n)    
+    moved(at, 0)
 
 def delete_backward_char():
     'Delete character before cursor'
+    at = cursor
     putstr(cub + dch % 1)
+    moved(at, -1)
 
 def forward_char():
+    at = cursor
     putstr(cuf) # move just one char
+    moved(at, 1)
 
 def backward_char():
+    at = cursor
     putstr(cub)
+    moved(at, -1)
 
 def move_to_column(column):
-    putstr(cha % column)
+    global cursor
+    at = cursor
+    if at:
+        putstr(horizontal(at[1], column))
+        cursor = (at[0], column)
+    else:
+        putstr(cha % column)
 
 # line also uses kill_line, defined below
 
@@ -103,27 +401,57 @@ def erase_above(): # erase from top of display to cursor
     putstr(eu)
 
 def put_cursor(line, column):      # not in emacs or gnu readline
-    putstr(cup % (line, column))
+    'Move cursor to line, column, with the shortest sequence, see motion'
+    global cursor
+    putstr(motion(cursor, line, column))
+    cursor = (line, column)
 
 def kill_line():
     'Erase from cursor to end of line'
+    at = cursor
     putstr(el_end)
+    moved(at, 0)
 
 def kill_whole_line():
     'Erase entire line'
+    at = cursor
     putstr(el_all)
+    moved(at, 0)
 
 def discard():
     'Erase from beginning of line to cursor'
+    at = cursor
     putstr(el_begin)
+    moved(at, 0)
 
 def set_scroll(ltop, lbottom):
     'Set scrolling region to lines ltop through lbottom (line numbers)'
+    global region, cursor
+    region = (ltop, lbottom)
     putstr(decstbm % (ltop, lbottom))
+    cursor = (1, 1) # decstbm homes the cursor
 
 def set_scroll_all():
     'Set scrolling region to entire display'
+    global region, cursor
+    region = None
     putstr(decstbmn)
+    cursor = (1, 1)
+
+def scroll(ltop, lbottom, nlines):
+    """
+    Scroll lines ltop through lbottom up nlines, down if nlines < 0,
+    leave blank lines at the other end.  Lines outside do not move.
+    Then restore the scrolling region and leave cursor at the top.
+    """
+    if nlines > 0: # at bottom of region, each index scrolls up one line
+        s = cup % (lbottom, 1) + ind * nlines
+    else:
+        s = cup % (ltop, 1) + ri * -nlines
+    global cursor
+    restore = decstbm % region if region else decstbmn
+    putstr(decstbm % (ltop, lbottom) + s + restore)
+    cursor = (1, 1) # decstbm homes the cursor
 
 def put_render(line, column, text, *attributes):
     """
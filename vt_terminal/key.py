@@ -60,6 +60,7 @@ C_w = '\x17' # ^W, etb
 C_x = '\x18' # ^X, can
 C_y = '\x19' # ^Y, em
 C_z = '\x1a' # ^Z, sub
+C_underscore = '\x1f' # ^_, us, also sent by ^/ on many terminals
 C_space = '\x99' # placeholder for'\x0' # ^space, alias for ^@, nul
 
 # Define Meta keys, prefixed with esc
@@ -100,6 +101,8 @@ M_percent = esc + '%' # emacs replace string
 
 M_carat = esc + '^' # emacs join lines
 
+C_M_underscore = esc + C_underscore # emacs redo
+
 # ANSI codes for arrow keys
 
 csi = esc+'[' # ANSI control sequence introducer
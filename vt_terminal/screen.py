@@ -0,0 +1,193 @@
+"""
+screen.py - Model of the text on the terminal display, so we can update
+            the display by sending only the characters that changed.
+
+Callers do not write lines on the display directly.  They call update or
+put to say what a line should show.  That only changes the desired line,
+here in memory, and marks the line damaged.  flush then compares each
+damaged line to what we know is shown on the display, and sends only the
+runs of characters that differ, each after the shortest cursor motion
+from where the last run ended (display.motion).  So an unchanged line
+costs nothing and a one character change costs a few bytes,
+no matter how many times a window is refreshed.
+
+Each line is a list of cells, one for each column, starting at column 1.
+Each cell is a tuple (ch, attrs): its character, and its attributes as a
+string for display.sgr, '' for none.  Blanks at the end of a line are not
+stored, display.kill_line erases them.
+
+screen only knows the lines written with update and put.  When something
+else writes on a line, like editline as the user types, call forget for
+that line, so the next update redraws it completely.  After the display
+is resized, call forget with no argument.
+
+To move many lines at once, like the lines in a window when it pages,
+scroll shifts them on the display and here, so the next flush only sends
+the lines that are new.
+
+flush leaves the cursor wherever it wrote last, so callers must put the
+cursor where they want it after flush.
+
+When the terminal falls behind (display.busy), flush sends nothing and
+leaves the lines damaged.  Later updates replace the desired lines, so
+the frames in between are never sent.  When the terminal catches up,
+deferred sends the latest lines and puts the cursor back where it was.
+"""
+
+import display
+
+# Define and initialize global variables used by this module,
+# but only the *first* time this module is imported.
+try:
+    _ = shown # if this variable is defined, then module was already imported
+except:
+    shown = {}    # line number to list of cells on display there, None unknown
+    desired = {}  # line number to list of cells we want there, None unknown
+    damaged = set() # line numbers where desired might differ from shown
+
+blank = (' ', '')
+
+def cells(text, *attributes):
+    'Return list of cells for text, each with the same attributes'
+    attrs = display.attrs(*attributes) if attributes else ''
+    if attrs == display.attrs(display.clear): attrs = ''
+    return [ (ch, attrs) for ch in text ]
+
+def trim(line):
+    'Return line without any blank cells at the end'
+    n = len(line)
+    while n and line[n-1] == blank:
+        n -= 1
+    return line[:n]
+
+def text(line):
+    'Return string that displays cells in line, send sgr only when attrs change'
+    s = []
+    attrs = ''
+    for ch, a in line:
+        if a != attrs:
+            s.append(display.sgr % (a or display.attrs(display.clear)))
+            attrs = a
+        s.append(ch)
+    if attrs:
+        s.append(display.sgr % display.attrs(display.clear))
+    return ''.join(s)
+
+def update(iline, line):
+    'Display line at display line iline, erase to the end of the line'
+    line = trim(line)
+    if desired.get(iline) != line or shown.get(iline) is None:
+        desired[iline] = line
+        damaged.add(iline)
+
+def put(iline, column, line):
+    'Display line at iline starting at column, leave the rest as it is'
+    old = desired.get(iline)
+    if old is None: # don't know the rest of this line, just write here
+        display.put_cursor(iline, column)
+        display.putstr(text(line))
+        return
+    new = old + [ blank ] * (column - 1 + len(line) - len(old))
+    new[column-1:column-1+len(line)] = line
+    update(iline, new)
+
+def forget(iline=None):
+    'Contents of line iline on display are unknown, or all lines if None'
+    lines = list(shown) + list(desired) if iline is None else [ iline ]
+    for i in lines:
+        shown[i] = desired[i] = None
+        damaged.discard(i)
+
+def erased(first, last):
+    'Lines first through last were erased on display, now blank'
+    for i in range(first, last+1):
+        shown[i] = desired[i] = []
+        damaged.discard(i)
+
+def scroll(top, bottom, nlines):
+    """
+    Scroll lines top through bottom up nlines on the display, down if
+    nlines < 0.  Send pending changes first, so they scroll too.
+    If the terminal is behind, don't scroll, flush redraws the lines later.
+    """
+    flush()
+    if display.busy():
+        damaged.update(range(top, bottom+1))
+        return
+    display.scroll(top, bottom, nlines)
+    lines = list(range(top, bottom+1))
+    if nlines < 0:
+        lines.reverse()
+    n = abs(nlines)
+    for i, iline in enumerate(lines): # line i+n moves to line i
+        shown[iline] = shown.get(lines[i+n]) if i+n < len(lines) else []
+        damaged.add(iline) # desired did not move, so flush compares them
+
+def spans(old, new):
+    'Return list of (start, end) runs of cells in new that differ from old'
+    runs = []
+    for i, cell in enumerate(new):
+        if i < len(old) and old[i] == cell:
+            continue
+        if runs and runs[-1][1] == i:
+            runs[-1][1] = i + 1
+        else:
+            runs.append([i, i + 1])
+    return runs
+
+def after(iline, column):
+    'Return cursor position after writing up to column, None if at the edge'
+    return (iline, column) if column <= display.columns else None
+
+def diff(iline, old, new, at):
+    """
+    Return string that changes display line iline from old to new,
+    and the cursor position after it.  at is the cursor position before.
+    """
+    if old is None: # unknown, so redraw the whole line
+        s = display.motion(at, iline, 1) + text(new) + display.el_end
+        return s, after(iline, len(new)+1)
+    s = []
+    end = 0
+    for start, stop in spans(old, new):
+        # between runs, rewriting the unchanged cells might be shortest
+        between = text(new[end:start]) if at == (iline, end+1) else None
+        s.append(display.motion(at, iline, start+1, between))
+        s.append(text(new[start:stop]))
+        at, end = after(iline, stop+1), stop
+    if len(old) > len(new): # erase old cells past end of new line
+        s.append(display.motion(at, iline, len(new)+1))
+        s.append(display.el_end)
+        at = (iline, len(new)+1)
+    return ''.join(s), at
+
+def changes(at):
+    """
+    Return string that sends the changes in all damaged lines, and the
+    cursor position after it.  at is the cursor position before.
+    """
+    s = []
+    for iline in sorted(damaged):
+        new = desired.get(iline)
+        if new is not None:
+            change, at = diff(iline, shown.get(iline), new, at)
+            s.append(change)
+            shown[iline] = new
+    damaged.clear()
+    return ''.join(s), at
+
+def flush():
+    'Send the changes in all damaged lines to the display, in one write'
+    if display.busy(): # terminal is behind, send latest lines when it catches up
+        display.when_drained(deferred)
+        return
+    s, at = changes(display.cursor)
+    if s:
+        display.putstr(s)
+        display.cursor = at
+
+def deferred():
+    'Send changes held back by flush, then put cursor back where it was'
+    s, _ = changes(None)
+    if s:
+        display.putstr(display.decsc + s + display.decrc)